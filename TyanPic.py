@@ -1,15 +1,12 @@
 import os
-import json
 import random
 import logging
 import asyncio
+import time
 from datetime import date, datetime
 from uuid import uuid4
-import difflib
-import requests
-import xml.etree.ElementTree as ET
 import re
-from urllib.parse import urlparse
+from urllib.parse import urlparse, urljoin
 
 import aiohttp
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
@@ -19,6 +16,7 @@ from telegram import (
     InlineKeyboardMarkup,
     InputMediaPhoto,
     InlineQueryResultPhoto,
+    InlineQueryResultGif,
 )
 from telegram.ext import (
     ApplicationBuilder,
@@ -26,16 +24,40 @@ from telegram.ext import (
     MessageHandler,
     CallbackQueryHandler,
     InlineQueryHandler,
+    TypeHandler,
+    ApplicationHandlerStop,
     ContextTypes,
     filters,
 )
-from telegram.error import BadRequest
-from cache import CUR, DB
+from telegram.error import BadRequest, Forbidden
+from cache import (
+    DB, DB_LOCK, neg_is_empty, neg_mark, neg_count, neg_top, fits_telegram,
+    reserved_take, pool_unserve,
+)
+from pool import ImageRecord, PoolRing
+from routing import router, supports
 from decouple import config
-from stats import incr, save, load
-from prefetch import prefetch, _insert, prefetch_wallhaven
+from prefetch import (
+    prefetch, _insert, _insert_many, prefetch_wallhaven, DANBOORU_ONLY,
+    DANBOORU_URL, SAFEBOORU_URL, KONACHAN_URL, WALLHAVEN_URL, WAIFU_PICS_URL,
+)
 from aiohttp import ClientTimeout
 from telegram.constants import ChatAction
+import broadcast
+import delivery
+import persist
+import favs as favstore
+from session import SessionCache
+from achievements import AchievementEngine
+from swap import SwapQueue
+from arts import ArtStore
+from reports import ReportLog
+from ratelimit import RateLimiter
+import state
+from concurrency import ChatOrderedUpdateProcessor
+import metrics
+from streamparse import XMLPosts, JSONArray, aiter_posts, url_ext
+from metrics import FETCH_LATENCY, VALIDATE_LATENCY, POOL_REQUESTS, CACHE_HITS, SOURCE_ERRORS, THROTTLED
 
 # ——— Configuration & Logging ———
 logging.basicConfig(format="%(asctime)s %(levelname)s %(message)s", level=logging.INFO)
@@ -43,52 +65,83 @@ logger = logging.getLogger(__name__)
 
 TELEGRAM_TOKEN    = config("TELEGRAM_TOKEN")
 WALLHAVEN_API_KEY = config("WALLHAVEN_API_KEY")
+TELEGRAM_API_URL  = config("TELEGRAM_API_URL", default="https://api.telegram.org")
+
+# ——— Run mode: polling (за замовчуванням) або webhook ———
+BOT_MODE        = config("BOT_MODE", default="polling")
+WEBHOOK_LISTEN  = config("WEBHOOK_LISTEN", default="0.0.0.0")
+WEBHOOK_PORT    = config("WEBHOOK_PORT", default=8443, cast=int)
+WEBHOOK_PATH    = config("WEBHOOK_PATH", default="/telegram")
+WEBHOOK_SECRET  = config("WEBHOOK_SECRET", default="")
+WEBHOOK_URL     = config("WEBHOOK_URL", default="")  # публічна адреса, напр. https://bot.example.com
+
+# ——— Local blob cache (вимкнено, якщо BLOB_CACHE_DIR порожній) ———
+BLOB_CACHE_DIR = config("BLOB_CACHE_DIR", default="")
+BLOB_CACHE_MB  = config("BLOB_CACHE_MB", default=2048, cast=int)
+
+# ——— Metrics: Prometheus-ендпойнт (0 — вимкнено) ———
+METRICS_PORT = config("METRICS_PORT", default=0, cast=int)
+
+# ——— Concurrency: паралельно між чатами, по черзі в межах чату ———
+MAX_IN_FLIGHT = config("MAX_IN_FLIGHT", default=64, cast=int)
+MAX_QUEUED    = config("MAX_QUEUED", default=1024, cast=int)
+
+# ——— Rate limit: token bucket на чат (0 — вимкнено) ———
+RATE_LIMIT = config("RATE_LIMIT", default=1, cast=int)
 
 # ——— Data files ———
 DATA_DIR    = os.path.join(os.path.dirname(__file__), "data")
 os.makedirs(DATA_DIR, exist_ok=True)
 FAVS_FILE   = os.path.join(os.path.dirname(__file__), "favorites.json")
-SUBS_FILE   = os.path.join(DATA_DIR, "subscribers.json")
+SUBS_FILE   = os.path.join(DATA_DIR, "subscribers.json")  # лише для разового імпорту в state
 STATS_FILE  = os.path.join(DATA_DIR, "stats.json")
 VIEWED_FILE = os.path.join(DATA_DIR, "viewed.json")
-REPORTS_FILE = os.path.join(os.path.dirname(__file__), "reports.json")
+REPORTS_FILE = os.path.join(os.path.dirname(__file__), "reports.jsonl")  # журнал, рядок на репорт
+LEGACY_REPORTS_FILE = os.path.join(os.path.dirname(__file__), "reports.json")
 PENDING_ARTS_FILE = os.path.join(DATA_DIR, "pending_arts.json")
-USER_ARTS_FILE = os.path.join(DATA_DIR, "user_arts.json")
+USER_ARTS_FILE = os.path.join(DATA_DIR, "user_arts.jsonl")  # журнал схвалених
+LEGACY_USER_ARTS_FILE = os.path.join(DATA_DIR, "user_arts.json")
 ACTIVE_USERS_FILE = os.path.join(DATA_DIR, "active_users.json")
 
 # ——— Admins ———
-ADMIN_IDS = {810423029}  # ваші Telegram ID для broadcast
+ADMIN_IDS = {810423029}  # ваші Telegram ID для /broadcast
 
 # ——— Persistence helpers ———
 def load_json(path, default):
-    if os.path.exists(path):
-        return json.load(open(path, encoding="utf-8"))
-    return default
-
-def save_json(path, data):
-    json.dump(data, open(path, "w", encoding="utf-8"), ensure_ascii=False, indent=2)
-
-favorites   = load_json(FAVS_FILE, {})
-subscribers = load_json(SUBS_FILE, {})
-stats       = load_json(STATS_FILE, {
-    "images_sent": 0,
-    "favorites_added": 0,
-    "favorites_by_tag": {},
-    "favorites_by_tag_date": {}
-})
-viewed      = load_json(VIEWED_FILE, {})
-pending_arts = load_json(PENDING_ARTS_FILE, [])
-user_arts = load_json(USER_ARTS_FILE, [])
+    return persist.read_json(path, default)
+
+# viewed.json читається не при імпорті, а в load_state() з on_startup.
+# Решта стану користувачів — у спільному state нижче.
+viewed = {}
 
 # ——— In-memory state ———
-last_image = {}  # chat_id → URL
-last_tag   = {}  # chat_id → tag
+SESSION_PERSIST = config("SESSION_PERSIST", default=True, cast=bool)
+blobs      = None  # BlobCache, створюється в on_startup
+sessions   = SessionCache(db=DB if SESSION_PERSIST else None, lock=DB_LOCK)  # chat_id → остання картинка
 user_lang  = {}  # chat_id → 'ua' or 'en'
 
 CATEGORIES = ["waifu","neko","hug","smile","kiss","pat","wink","cuddle"]
 APIS       = ["waifu.pics", "danbooru", "wallhaven", "safebooru", "konachan"]
 
-pending_reports = set()  # chat_id тих, хто зараз пише репорт
+# ——— Shared state (спільний для всіх воркерів) ———
+STATE_URL = config("STATE_URL", default="sqlite:///" + os.path.join(DATA_DIR, "state.db"))
+WORKER_ID = config("WORKER_ID", default=state.DEFAULT_WORKER_ID)
+SCHEDULER_LEASE_TTL = 90  # сек; лідер продовжує lease щохвилини
+
+state_backend   = state.make_backend(STATE_URL)
+report_log      = ReportLog(REPORTS_FILE, LEGACY_REPORTS_FILE)
+pending_reports = state.SharedSet(state_backend, "pending_reports")  # chat_id тих, хто зараз пише репорт
+sendart_waiting = state.SharedSet(state_backend, "sendart_waiting")
+swap_waiting    = state.SharedSet(state_backend, "swap_waiting")
+swap_pool       = SwapQueue(state_backend)
+subscribers     = state.SharedDict(state_backend, "subscribers")  # chat_id → налаштування розсилки
+active_users    = state.SharedDict(state_backend, "active_users")  # chat_id → {id, username, first, last}
+favorites       = favstore.SharedFavorites(state_backend)
+stats           = state.SharedCounter(state_backend, "stats")  # images_sent, favorites_added
+tag_likes       = state.SharedCounter(state_backend, "favorites_by_tag")
+tag_likes_daily = state.SharedCounter(state_backend, "favorites_by_tag_date")  # "дата|тег" → n
+art_store       = ArtStore(state_backend)
+achievements    = AchievementEngine(state_backend)
 chat_ended = set()  # chat_id, де чат завершено
 
 # ——— Localization ———
@@ -123,6 +176,7 @@ LOCALES = {
 /langen — англійська мова
 /report — поскаржитись на картинку
 /badges — ваші досягнення
+/swap — обмін картинками
 /swap_status — статус обміну
 /sendart — надіслати свою картинку на модерацію
 /arts — переглянути роботи користувачів
@@ -178,10 +232,12 @@ LOCALES = {
         "swap_send": "Надішліть зображення для обміну.",
         "swap_wait": "Чекаємо іншого учасника…",
         "swap_done": "🎁 Ось ваш обмін!",
+        "swap_expired": "Ніхто не приєднався до обміну. Спробуйте ще раз — /swap",
         "badges_none": "У вас поки немає бейджів 😅",
         "badges_list": "Ваші бейджі:\n{badges}",
         "report_prompt": "Опишіть проблему одним повідомленням. Ваш текст буде надіслано адміну.",
         "report_sent": "Дякую! Ваше повідомлення надіслано адміну.",
+        "throttled": "⏳ Забагато запитів. Спробуйте за {sec} с.",
         "photo_received": "Фото отримано, але воно не підпадає під жодну дію.",
         "clearstats_done": "Статистика очищена.",
         "clearlike_done": "Ваші лайки очищено.",
@@ -199,6 +255,8 @@ LOCALES = {
         "swap_status": "Зараз у черзі: {count} людей.",
         "no_image_to_like": "Немає картинки для додавання в улюbлені.",
         "no_trending_tags": "Ще немає трендових тегів.",
+        "favs_page": "Сторінка {page}/{total}",
+        "favs_next": "Далі ▶",
     },
     "en": {
         "welcome": "Welcome! Choose an action or /help for instructions:",
@@ -230,6 +288,7 @@ LOCALES = {
 /langen — English language
 /report — report an art
 /badges — your achievements
+/swap — swap arts
 /swap_status — swap status
 /sendart — submit your art for moderation
 /arts — view user-submitted arts
@@ -284,10 +343,12 @@ LOCALES = {
         "swap_send": "Send an image for swap.",
         "swap_wait": "Waiting for another participant…",
         "swap_done": "🎁 Here is your swap!",
+        "swap_expired": "Nobody joined the swap. Try again — /swap",
         "badges_none": "You have no badges yet 😅",
         "badges_list": "Your badges:\n{badges}",
         "report_prompt": "Describe the problem in one message. Your text will be sent to the admin.",
         "report_sent": "Thank you! Your message has been sent to the admin.",
+        "throttled": "⏳ Too many requests. Try again in {sec}s.",
         "photo_received": "Photo received, but it does not match any action.",
         "clearstats_done": "Stats cleared.",
         "clearlike_done": "Your likes have been cleared.",
@@ -305,6 +366,8 @@ LOCALES = {
         "swap_status": "Currently in queue: {count} people.",
         "no_image_to_like": "No image to add to favorites.",
         "no_trending_tags": "No trending tags yet.",
+        "favs_page": "Page {page}/{total}",
+        "favs_next": "Next ▶",
     }
 }
 
@@ -320,103 +383,120 @@ async def ensure_session():
         _session = aiohttp.ClientSession()
 
 # ——— Image fetchers ———
+# None — джерело відповіло 200, але для тегу нічого немає (тоді fetch_image
+# ставить негативний кеш). Мережеві помилки, таймаути, 4xx/5xx — винятки:
+# це збій джерела, а не «мертвий» тег.
 async def get_waifu_pics(tag):
     await ensure_session()
-    try:
-        r = await _session.get(f"https://api.waifu.pics/sfw/{tag}", timeout=10)
-        r.raise_for_status()
-        return (await r.json())["url"]
-    except:
-        return None
+    r = await _session.get(f"{WAIFU_PICS_URL}/sfw/{tag}", timeout=10)
+    r.raise_for_status()
+    return (await r.json()).get("url")
 
 async def get_danbooru(tag):
+    # кілька постів, а не один: серед них бувають mp4/webm/zip і завеликі файли
     await ensure_session()
-    url = f"https://danbooru.donmai.us/posts.json?tags={tag}+rating:safe+order:random&limit=1"
-    try:
-        r = await _session.get(url, timeout=10); r.raise_for_status()
-        posts = await r.json()
-        return posts[0]["file_url"] if posts else None
-    except:
-        return None
+    url = f"{DANBOORU_URL}/posts.json?tags={tag}+rating:safe+order:random&limit=20&only={DANBOORU_ONLY}"
+    async with _session.get(url, timeout=10) as resp:
+        resp.raise_for_status()
+        posts = [p async for p in aiter_posts(resp, JSONArray())]
+    return pick_and_pool(tag, "danbooru", posts)
 
 async def get_wallhaven(tag):
     await ensure_session()
     url = (
-        f"https://wallhaven.cc/api/v1/search?q={tag}"
+        f"{WALLHAVEN_URL}/api/v1/search?q={tag}"
         f"&categories=1&purity=1&sorting=random&atleast=1920x1080"
         f"&apikey={WALLHAVEN_API_KEY}"
     )
-    try:
-        r = await _session.get(url, timeout=10); r.raise_for_status()
-        data = await r.json(); hits = data.get("data",[])
-        return f"https://wallhaven.cc{hits[0]['path']}" if hits else None
-    except:
+    r = await _session.get(url, timeout=10); r.raise_for_status()
+    data = await r.json(); hits = data.get("data",[])
+    posts = [{
+        "url": p.get("path"), "md5": None,
+        "width": p.get("dimension_x"), "height": p.get("dimension_y"),
+        "size": p.get("file_size"), "ext": url_ext(p.get("path")),
+    } for p in hits]
+    return pick_and_pool(tag, "wallhaven", posts, base=WALLHAVEN_URL)
+
+def pick_and_pool(tag, api, posts, base=None):
+    # Один пост віддаємо зараз, решту сторінки — у пул (у потоці),
+    # щоб наступні запити цього тегу не йшли в мережу.
+    posts = [p for p in posts if p["url"]]
+    if not posts:
         return None
+    if base:
+        for p in posts:
+            p["url"] = urljoin(base, p["url"])
+    # наживо віддаємо лише те, що Telegram точно прийме
+    fit = [i for i, p in enumerate(posts)
+           if fits_telegram(p["width"], p["height"], p["size"], p["ext"])]
+    post = posts.pop(random.choice(fit)) if fit else None
+    if posts:
+        asyncio.get_running_loop().run_in_executor(None, _insert_many, tag, api, posts)
+    return post["url"] if post else ""  # "" — пости є, але жоден не підходить
 
 async def get_safebooru(tag):
     url = (
-        "https://safebooru.org/index.php"
+        f"{SAFEBOORU_URL}/index.php"
         f"?page=dapi&s=post&q=index&limit=100&tags={tag}"
     )
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, timeout=10) as resp:
-                if resp.status != 200:
-                    return None, None
-                xml = await resp.text()
-                root = ET.fromstring(xml)
-                posts = root.findall("post")
-                if not posts:
-                    return None, None
-                import random
-                post = random.choice(posts)
-                url = f"https://safebooru.org{post.attrib.get('file_url', '')}"
-                if not url:
-                    return None, None
-                return url, "safebooru"
-    except Exception as e:
-        print(f"Safebooru error: {e}")
-        return None, None
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url, timeout=10) as resp:
+            resp.raise_for_status()
+            posts = [p async for p in aiter_posts(resp, XMLPosts())]
+    return pick_and_pool(tag, "safebooru", posts, base=SAFEBOORU_URL)
 
 async def get_konachan(tag):
     url = (
-        "https://konachan.net/post.json"
+        f"{KONACHAN_URL}/post.json"
         f"?limit=100&tags={tag}+rating:safe"
     )
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, timeout=10) as resp:
-                if resp.status != 200:
-                    return None, None
-                posts = await resp.json()
-                if not posts:
-                    return None, None
-                import random
-                post = random.choice(posts)
-                file_url = post.get("file_url")
-                if not file_url:
-                    return None, None
-                return file_url, "konachan"
-    except Exception as e:
-        print(f"Konachan error: {e}")
-        return None, None
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url, timeout=10) as resp:
+            resp.raise_for_status()
+            posts = [p async for p in aiter_posts(resp, JSONArray())]
+    return pick_and_pool(tag, "konachan", posts)
+
+FETCH_APIS = [
+    ("waifu.pics",    get_waifu_pics),
+    ("safebooru",     get_safebooru),
+    ("danbooru",      get_danbooru),
+    ("wallhaven",     get_wallhaven),
+]
+
+FETCH_FNS = dict(FETCH_APIS)
+
+def is_dead_tag(tag):
+    return all(neg_is_empty(tag, name) for name, _ in FETCH_APIS if supports(name, tag))
 
 async def fetch_image(tag: str):
-    apis = [
-        ("waifu.pics",    get_waifu_pics),
-        ("safebooru",     get_safebooru),
-        ("danbooru",      get_danbooru),
-        ("wallhaven",     get_wallhaven),
-    ]
-    for name, fn in apis:
+    tried = False
+    # джерела — у порядку, який routing.py вивчив для цього тегу
+    for name in router.order(tag, FETCH_FNS):
+        # Тег уже нічого не давав з цього джерела — не смикаємо API
+        if neg_is_empty(tag, name):
+            CACHE_HITS.inc("negative")
+            continue
+        tried = True
+        start = time.perf_counter()
         try:
-            url = await asyncio.wait_for(fn(tag), timeout=3.0)
-            if url and await validate_url(url):
-                return url, name
-        except asyncio.TimeoutError:
+            with FETCH_LATENCY.time(name):
+                url = await asyncio.wait_for(FETCH_FNS[name](tag), timeout=3.0)
+        except Exception as e:  # у т.ч. asyncio.TimeoutError, HTTP 429/5xx
+            logger.debug("%s error: %s", name, e)
+            SOURCE_ERRORS.inc(name)
+            router.record(tag, name, False, time.perf_counter() - start)
             continue
-        except Exception:
+        if not url:
+            if url is None:  # порожня відповідь 200 — тег для джерела справді мертвий
+                neg_mark(tag, name)
+            router.record(tag, name, False, time.perf_counter() - start)
             continue
+        ok = await validate_url(url)
+        router.record(tag, name, ok, time.perf_counter() - start)
+        if ok:
+            return url, name
+    if not tried:
+        neg_count(tag)
     return None, None
 
 # ——— Keyboards ———
@@ -466,117 +546,6 @@ def kb_lang():
     ])
 
 # ——— Art Swap & Achievements ———
-SWAP_POOL_FILE = os.path.join(DATA_DIR, "data_swap_pool.json")
-ACHIEVEMENTS_FILE = os.path.join(DATA_DIR, "data_achievements.json")
-
-swap_pool = load_json(SWAP_POOL_FILE, {})
-achievements = load_json(ACHIEVEMENTS_FILE, {})
-
-BADGES = {
-    "first_art": ("🎨 Перша картинка", "send_art"),
-    "first_like": ("👍 Перший лайк", "like"),
-    "arts_viewed": [
-        (10, "👀 10 картинок"), (50, "👁 50 картинок"), (100, "🧿 100 картинок")
-    ],
-    "collector": ("🏆 Колекціонер", "all_tag"),
-    "first_swap": ("🔄 Перший обмін", "swap"),
-    "moderator": ("🛡️ Модератор", "moderate"),
-    "gallery": (5, "🖼 Галерист"),
-    "trendsetter": (10, "🔥 Творець тренду"),
-    "favorite": (50, "🌟 Улюбленець"),
-    "multigenre": (5, "🎭 Мультижанр"),
-    "tagmaster": (3, "🏷️ Тег-майстер"),
-    "first_caption": ("✍️ Перший коментар", "caption"),
-    "earlybird": ("🌅 Ранній птах", "early"),
-    "nightowl": ("🌙 Нічна сова", "night"),
-    "dailyfan": (7, "📅 Щоденний фан"),
-    "secret_tag": ("🕵️‍♂️ Секретний тег", "secret"),
-    "memmaster": ("😂 Мем-майстер", "meme"),
-}
-
-def update_achievements(cid, event=None, extra=None):
-    global achievements
-    cid = str(cid)
-    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    if cid not in achievements:
-        achievements[cid] = []
-    user_ach = achievements[cid]
-
-    def add_badge(name):
-        if not any(a["achievement"] == name for a in user_ach):
-            user_ach.append({"achievement": name, "date": now})
-
-    # 1. Перший арт
-    if event == "send_art":
-        add_badge(BADGES["first_art"][0])
-
-    # 2. Перший лайк
-    if event == "like" and extra == 1:
-        add_badge(BADGES["first_like"][0])
-
-    # 3. Переглянуто N арту
-    if event == "view_art":
-        for n, name in BADGES["arts_viewed"]:
-            if extra == n:
-                add_badge(name)
-
-    # 4. Колекціонер (всі арти з тегу)
-    if event == "all_tag":
-        add_badge(BADGES["collector"][0])
-
-    # 5. Перший обмін
-    if event == "swap":
-        add_badge(BADGES["first_swap"][0])
-
-    # 6. Модератор
-    if event == "moderate":
-        add_badge(BADGES["moderator"][0])
-
-    # 7. Галерист (5 схвалених арту)
-    if event == "gallery" and extra == 5:
-        add_badge(BADGES["gallery"][1])
-
-    # 8. Творець тренду (арт отримав 10+ лайків)
-    if event == "trend" and extra >= BADGES["trendsetter"][0]:
-        add_badge(BADGES["trendsetter"][1])
-
-    # 9. Улюбленець (арт переглянули 50+ разів)
-    if event == "favorite" and extra >= BADGES["favorite"][0]:
-        add_badge(BADGES["favorite"][1])
-
-    # 10. Мультижанр (5 різних тегів)
-    if event == "multigenre" and extra == BADGES["multigenre"][0]:
-        add_badge(BADGES["multigenre"][1])
-
-    # 11. Тег-майстер (3 різних тегів)
-    if event == "tagmaster" and extra == BADGES["tagmaster"][0]:
-        add_badge(BADGES["tagmaster"][1])
-
-    # 12. Перший коментар
-    if event == "caption":
-        add_badge(BADGES["first_caption"][0])
-
-    # 13. Ранній птах
-    if event == "early":
-        add_badge(BADGES["earlybird"][0])
-
-    # 14. Нічна сова
-    if event == "night":
-        add_badge(BADGES["nightowl"][0])
-
-    # 15. Щоденний фан (7 днів підряд)
-    if event == "dailyfan" and extra == BADGES["dailyfan"][0]:
-        add_badge(BADGES["dailyfan"][1])
-
-    # 16. Секретний тег
-    if event == "secret":
-        add_badge(BADGES["secret_tag"][0])
-
-    # 17. Мем-майстер
-    if event == "meme":
-        add_badge(BADGES["memmaster"][0])
-
-    save_json(ACHIEVEMENTS_FILE, achievements)
 
 # ——— Handlers ———
 async def start(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
@@ -584,12 +553,9 @@ async def start(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     if cid in chat_ended:
         chat_ended.remove(cid)
     username = update.effective_user.username
-    add_active_user(cid, username, active_users)
+    await add_active_user(cid, username)
     if cid not in user_lang:
         user_lang[cid] = "en"
-    if cid not in active_users:
-        active_users.append({"id": cid, "username": username or ""})
-        save_active_users(active_users)
     welcome_text = f"{t(cid, 'welcome')}\n\n{t(cid, 'menu')}"
     await update.message.reply_text(welcome_text, reply_markup=kb_main(cid))
 
@@ -607,12 +573,20 @@ async def inline_q(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         return
     url, api = await fetch_image(query.replace(" ", "_").lower())
     if url:
-        result = InlineQueryResultPhoto(
-            id=str(uuid4()),
-            photo_url=url,
-            thumbnail_url=url,
-            caption=f"{query} ({api})"
-        )
+        if url_ext(url) == "gif":
+            result = InlineQueryResultGif(
+                id=str(uuid4()),
+                gif_url=url,
+                thumbnail_url=url,
+                caption=f"{query} ({api})"
+            )
+        else:
+            result = InlineQueryResultPhoto(
+                id=str(uuid4()),
+                photo_url=url,
+                thumbnail_url=url,
+                caption=f"{query} ({api})"
+            )
         await ctx.bot.answer_inline_query(update.inline_query.id, [result], cache_time=0)
 
 async def cb_handler(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
@@ -628,7 +602,7 @@ async def cb_handler(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     if data == "START":
         await ctx.bot.send_message(cid, t(cid, "search_prompt"), reply_markup=kb_cats())
     elif data == "SUBSCRIBE":
-        if str(cid) in subscribers:
+        if await subscribers.contains(cid):
             await ctx.bot.send_message(cid, t(cid, "already_subscribed"))
         else:
             await ctx.bot.send_message(cid, t(cid, "subscribe_prompt"))
@@ -638,21 +612,17 @@ async def cb_handler(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         tag = data.split("|", 1)[1]
         await on_tag(update, ctx, tag)
     elif data == "SHOW_FAVS":
-        favs = favorites.get(str(cid), [])
-        if not favs:
-            await ctx.bot.send_message(cid, t(cid, "no_likes"))
-        else:
-            media = [InputMediaPhoto(u) for u in favs[:10]]
-            await ctx.bot.send_media_group(cid, media)
+        await send_favs_page(ctx, cid, 0)
+    elif data.startswith("FAVS|"):
+        await send_favs_page(ctx, cid, int(data.split("|", 1)[1]))
     elif data == "RANDOM_FAV":
-        favs = favorites.get(str(cid), [])
+        favs = await favorites.get(cid)
         if not favs:
             await ctx.bot.send_message(cid, t(cid, "no_likes"))
         else:
-            url = random.choice(favs)
-            await ctx.bot.send_photo(cid, photo=url, caption=t(cid, "random_fav_caption"))
+            await ctx.bot.send_photo(cid, photo=favs.random(), caption=t(cid, "random_fav_caption"))
     elif data == "TRENDING":
-        tag_stats = stats.get("favorites_by_tag", {})
+        tag_stats = await tag_likes.items()
         if not tag_stats:
             await ctx.bot.send_message(cid, t(cid, "no_trending_tags"))
             return
@@ -686,54 +656,185 @@ async def msg_handler(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     cid = update.effective_chat.id
     if cid in chat_ended:
         chat_ended.remove(cid)
-    if cid in pending_reports:
-        # Надіслати адміну
-        admin_id = list(ADMIN_IDS)[0]  # твій Telegram ID
-        text = f"⚠️ Report from @{update.effective_user.username or cid} ({cid}):\n{update.message.text}" if user_lang.get(str(cid), "en") == "en" else f"⚠️ Репорт від @{update.effective_user.username or cid} ({cid}):\n{update.message.text}"
-        try:
-            await ctx.bot.send_message(admin_id, text)
-        except Exception as e:
-            print(f"Не вдалося надіслати адміну: {e}")
-        await update.message.reply_text(t(cid, "report_sent"))
-        # Зберегти у reports.json
+    if await pending_reports.contains(cid):
+        # Дописати в журнал репортів (без перечитування всього файлу)
+        sess = sessions.get(cid) or {}
         report_entry = {
             "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "ts": int(time.time()),
             "username": f"@{update.effective_user.username}" if update.effective_user.username else str(cid),
             "user_id": cid,
-            "text": update.message.text
+            "text": update.message.text,
+            "image": sess.get("url"),
+            "tag": sess.get("tag"),
         }
-        try:
-            with open(REPORTS_FILE, "r", encoding="utf-8") as f:
-                reports = json.load(f)
-        except Exception:
-            reports = []
-        reports.append(report_entry)
-        with open(REPORTS_FILE, "w", encoding="utf-8") as f:
-            json.dump(reports, f, ensure_ascii=False, indent=2)
-        pending_reports.remove(cid)
+        group, notify = await asyncio.to_thread(report_log.add, report_entry)
+        # Надіслати адміну — на одну картинку лише перший репорт і пороги «шторму»
+        if notify:
+            admin_id = list(ADMIN_IDS)[0]  # твій Telegram ID
+            text = f"⚠️ Report from @{update.effective_user.username or cid} ({cid}):\n{update.message.text}" if user_lang.get(str(cid), "en") == "en" else f"⚠️ Репорт від @{update.effective_user.username or cid} ({cid}):\n{update.message.text}"
+            if group:
+                text += f"\n\n🖼 {report_entry['image']}"
+                if group["count"] > 1:
+                    text += f"\n🔥 {group['count']} reports from {len(group['users'])} users in the last hour"
+            try:
+                await ctx.bot.send_message(admin_id, text)
+            except Exception as e:
+                print(f"Не вдалося надіслати адміну: {e}")
+        await update.message.reply_text(t(cid, "report_sent"))
+        await pending_reports.discard(cid)
         return
     tag = update.message.text.strip().replace(" ", "_" ).lower()
-    if not is_pool_ready(tag):
-        asyncio.create_task(prefetch(tag, 200))
     await on_tag(update, ctx, tag)
 
+# ——— Rate limit ———
+limiter = RateLimiter()
+# кнопки й команди, що ведуть в on_tag (до 4 запитів нагору + 5 викликів Bot API)
+IMAGE_CALLBACKS = ("TAG|", "SHOW_TAG|", "RANDOM_FAV")
+IMAGE_COMMANDS  = {"same", "similar", "random_fav", *CATEGORIES}
+
+def request_kind(update):
+    if update.inline_query:
+        return "inline", update.inline_query.from_user.id
+    chat = update.effective_chat
+    if chat is None:
+        return None, None
+    if update.callback_query:
+        data = update.callback_query.data or ""
+        return ("tag" if data.startswith(IMAGE_CALLBACKS) else "command"), chat.id
+    msg = update.message
+    if msg is None:
+        return None, None
+    text = msg.text or ""
+    if text.startswith("/"):
+        cmd = text[1:].split(maxsplit=1)[0].split("@", 1)[0].lower() if len(text) > 1 else ""
+        return ("tag" if cmd in IMAGE_COMMANDS else "command"), chat.id
+    return ("tag" if text else "command"), chat.id
+
+async def throttle(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    # група -1: відсікає зайве до того, як спрацює будь-який хендлер
+    kind, key = request_kind(update)
+    if kind is None or key in ADMIN_IDS:
+        return
+    ok, warn = limiter.hit(kind, key)
+    if ok:
+        return
+    THROTTLED.inc(kind)
+    sec = max(1, round(limiter.retry_after(kind, key)))
+    if update.callback_query:
+        # відповідь на кнопку все одно потрібна, щоб прибрати «годинник»
+        await update.callback_query.answer(t(key, "throttled", sec=sec), show_alert=False)
+    elif warn and update.message:
+        await update.message.reply_text(t(key, "throttled", sec=sec))
+    raise ApplicationHandlerStop
+
+# ——— Pool ———
+POOL_READY = 20          # розмір пачки, яку кільце забирає з SQLite за раз
+_prefetching = set()     # теги, які зараз докачуються
+_prefetch_tasks = set()  # їхні asyncio-задачі
+pool_ring = PoolRing(batch=POOL_READY, owner=f"{WORKER_ID}-{uuid4().hex[:8]}")  # tag → готові ImageRecord у пам'яті
+
+def is_pool_ready(tag):
+    return not pool_ring.low(tag)
+
+def schedule_prefetch(tag, total=200):
+    if tag in _prefetching:
+        return
+    _prefetching.add(tag)
+    task = asyncio.create_task(asyncio.to_thread(prefetch, tag, total))
+    _prefetch_tasks.add(task)
+    def done(_):
+        _prefetching.discard(tag)
+        _prefetch_tasks.discard(task)
+        pool_ring.replenished(tag)
+    task.add_done_callback(done)
+
+async def drain_prefetch():
+    # дочекатись фонових докачок (bench, тести)
+    while _prefetch_tasks:
+        await asyncio.gather(*list(_prefetch_tasks), return_exceptions=True)
+
+# Якщо відповідь швидка — жодних «Завантаження…»: одне send_photo.
+# Повільніше LOADING_ACTION_DELAY — показуємо chat action, повільніше
+# LOADING_MSG_DELAY — ще й текстове повідомлення.
+LOADING_ACTION_DELAY = 0.7
+LOADING_MSG_DELAY    = 3.0
+LIVE_TRIES           = 2  # спроб наживо, якщо Telegram відхилив картинку
+
 async def on_tag(update, ctx, tag):
     cid = update.effective_chat.id
-    await ctx.bot.send_chat_action(cid, ChatAction.UPLOAD_PHOTO)
-    loading = await ctx.bot.send_message(cid, t(cid, "loading"))
-
-    url, api = await fetch_image(tag)
-
-    await ctx.bot.delete_message(cid, loading.message_id)
-
-    if not url:
+    if is_dead_tag(tag):
+        neg_count(tag)
         await ctx.bot.send_message(cid, t(cid, "img_not_found"))
         return
-    await ctx.bot.send_photo(cid, photo=url, caption=f"{tag} ({api})")
-    await send_after_photo_menu(cid, ctx)
+    rec = pool_ring.take(tag)
+    POOL_REQUESTS.inc("hit" if rec else "miss")
+    if not is_pool_ready(tag):
+        schedule_prefetch(tag)
+    if rec:
+        try:
+            await send_tag_photo(ctx, cid, rec)
+            return
+        except BadRequest:
+            pass  # битий лінк у пулі — шукаємо наживо
+    for _ in range(LIVE_TRIES):
+        url, api = await fetch_with_indicator(ctx, cid, tag)
+        if not url:
+            break
+        try:
+            await send_tag_photo(ctx, cid, ImageRecord(url, api, tag))
+            return
+        except BadRequest as e:
+            logger.debug("live %s rejected: %s", url, e)  # Telegram не прийняв файл — ще раз наживо
+    await ctx.bot.send_message(cid, t(cid, "img_not_found"))
+
+async def fetch_with_indicator(ctx, cid, tag):
+    fetch = asyncio.create_task(fetch_image(tag))
+    done, _ = await asyncio.wait({fetch}, timeout=LOADING_ACTION_DELAY)
+    if done:
+        return fetch.result()
+    await ctx.bot.send_chat_action(cid, ChatAction.UPLOAD_PHOTO)
+    done, _ = await asyncio.wait({fetch}, timeout=LOADING_MSG_DELAY - LOADING_ACTION_DELAY)
+    if done:
+        return fetch.result()
+    loading = await ctx.bot.send_message(cid, t(cid, "loading"))
+    try:
+        return await fetch
+    finally:
+        await ctx.bot.delete_message(cid, loading.message_id)
+
+async def send_image(bot, cid, url, caption=None):
+    # GIF через send_photo Telegram відхиляє — такі йдуть як анімація
+    if url_ext(url) == "gif":
+        return await bot.send_animation(cid, animation=url, caption=caption)
+    return await bot.send_photo(cid, photo=url, caption=caption)
+
+async def send_tag_photo(ctx, cid, rec):
+    # підказки (/next, /same, /like) — у підписі, без окремого повідомлення
+    caption = f"{rec.tag} ({rec.api})\n\n{t(cid, 'followup')}"
+    # для GIF локальний кеш тримає лише статичний кадр — не підходить
+    local = blobs.get(rec.md5) if blobs and rec.md5 and not rec.animated else None
+    if local:
+        CACHE_HITS.inc("blob")
+        # зменшена локальна копія — Telegram не тягне оригінал з буру
+        with open(local, "rb") as f:
+            msg = await ctx.bot.send_photo(cid, photo=f, caption=caption)
+    else:
+        msg = await send_image(ctx.bot, cid, rec.url, caption)
+    media = msg.animation or (msg.photo[-1] if msg.photo else None)
+    if media:
+        rec.file_id = media.file_id
+    sessions.set(cid, rec.url, rec.tag, rec.api, rec.file_id)
+    emit_view_events(cid)
+
+def emit_view_events(cid):
+    achievements.emit(cid, "view_art")
+    hour = datetime.now().hour
+    if 5 <= hour < 8:
+        achievements.emit(cid, "early")
+    elif hour < 5:
+        achievements.emit(cid, "night")
 
-async def send_after_photo_menu(cid, ctx):
-    await ctx.bot.send_message(cid, t(cid, "followup"))
 
 async def next_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     cid = update.effective_chat.id
@@ -742,7 +843,8 @@ async def next_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
 async def same_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     cid = update.effective_chat.id
-    tag = last_tag.get(cid)
+    last = sessions.get(cid)
+    tag = last["tag"] if last else None
     if not tag:
         await ctx.bot.send_message(cid, t(cid, "no_prev_tag"))
     else:
@@ -760,69 +862,130 @@ async def subscribe_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     if args[0] == "daily":
         hour = int(args[1]) if len(args) > 1 else 9
         count = int(args[2]) if len(args) > 2 else 1
-        subscribers[cid] = {"interval": None, "count": count, "hour": hour}
-        save_json(SUBS_FILE, subscribers)
+        await subscribers.set(cid, {"interval": None, "count": count, "hour": hour})
         await update.message.reply_text(t(cid, "daily_subscribe_confirm", hour=hour, count=count))
     else:
         interval = int(args[0])
         count = int(args[1]) if len(args) > 1 else 1
-        subscribers[cid] = {"interval": interval, "count": count, "hour": None}
-        save_json(SUBS_FILE, subscribers)
+        await subscribers.set(cid, {"interval": interval, "count": count, "hour": None})
         await update.message.reply_text(t(cid, "subscribe_confirm", interval=interval, count=count))
 
+async def scheduled_images(cid, count):
+    # спершу відкладене під цей чат, решта — з пулу; нагору не ходимо.
+    # (url, api, ImageRecord | None) — запис кільця, щоб повернути невідправлене
+    images = [(url, api, None) for url, api in await asyncio.to_thread(reserved_take, cid, count)]
+    for _ in range(count - len(images)):
+        rec = pool_ring.take(random.choice(CATEGORIES))
+        if rec:
+            images.append((rec.url, rec.api, rec))
+    return images
+
+async def return_unsent(images):
+    for _, _, rec in images:
+        if rec:
+            pool_ring.put_back(rec)
+    urls = [url for url, _, rec in images if rec is None]
+    if urls:
+        await asyncio.to_thread(pool_unserve, urls)
+
+async def deliver(cid, sub, caption_key, done):
+    # done — поля, що фіксуються після кожної відправленої картинки
+    images = await scheduled_images(cid, sub["count"])
+    for i, (url, api, _) in enumerate(images):
+        try:
+            await send_image(app.bot, int(cid), url, t(cid, caption_key, api=api))
+        except BadRequest:
+            await return_unsent(images[i + 1:])  # битий лінк назад не повертаємо
+            raise
+        except BaseException:
+            await return_unsent(images[i:])
+            raise
+        sub["last_sent"] = url
+        sub.setdefault("all_sent", []).append(url)
+        sub.update(done)
+
 async def send_scheduled():
+    # при кількох воркерах розсилку робить лише власник lease; підписники —
+    # у спільному state, тож бачимо і тих, хто підписався через інший воркер
+    if not await state_backend.acquire_lease("scheduler", WORKER_ID, SCHEDULER_LEASE_TTL):
+        return
     now = datetime.now()
-    for cid, sub in subscribers.items():
-        if sub.get("interval"):
-            last = sub.get("last_sent", 0)
-            if isinstance(last, str):
-                last_time = sub.get("last_time", 0)
-            else:
-                last_time = last
-            if now.timestamp() - last_time >= sub["interval"] * 60:
-                for _ in range(sub["count"]):
-                    url, api = await fetch_image(random.choice(CATEGORIES))
-                    if url:
-                        await app.bot.send_photo(chat_id=int(cid), photo=url, caption=t(cid, "scheduled_caption", api=api))
-                        sub["last_sent"] = url
-                        sub["last_time"] = now.timestamp()
-                        if "all_sent" not in sub:
-                            sub["all_sent"] = []
-                        sub["all_sent"].append(url)
-        elif sub.get("hour") is not None:
-            last_day = sub.get("last_day", None)
-            if now.hour == sub["hour"] and (last_day != now.date().isoformat()):
-                for _ in range(sub["count"]):
-                    url, api = await fetch_image(random.choice(CATEGORIES))
-                    if url:
-                        await app.bot.send_photo(chat_id=int(cid), photo=url, caption=t(cid, "daily_caption", api=api))
-                        sub["last_sent"] = url
-                        if "all_sent" not in sub:
-                            sub["all_sent"] = []
-                        sub["all_sent"].append(url)
-                sub["last_day"] = now.date().isoformat()
-    save_json(SUBS_FILE, subscribers)
+    subs = await subscribers.items()
+    # резерв на найближче вікно; дефіцит докачується у фоні, не під час розсилки
+    short = await asyncio.to_thread(delivery.reserve_ahead, list(subs.items()), CATEGORIES, now)
+    for tag in short:
+        schedule_prefetch(tag)
+    for cid, sub in subs.items():
+        before = dict(sub)
+        try:
+            if sub.get("interval"):
+                last = sub.get("last_sent", 0)
+                if isinstance(last, str):
+                    last_time = sub.get("last_time", 0)
+                else:
+                    last_time = last
+                if now.timestamp() - last_time >= sub["interval"] * 60:
+                    await deliver(cid, sub, "scheduled_caption", {"last_time": now.timestamp()})
+            elif sub.get("hour") is not None:
+                last_day = sub.get("last_day", None)
+                if now.hour == sub["hour"] and (last_day != now.date().isoformat()):
+                    # день зараховуємо лише після реальної відправки: якщо пул
+                    # порожній, пробуємо знову наступної хвилини в межах години
+                    await deliver(cid, sub, "daily_caption", {"last_day": now.date().isoformat()})
+        except Forbidden:
+            # бота заблокували або чат видалено — підписка більше не діє
+            logger.info("subscriber %s is unreachable, unsubscribing", cid)
+            await subscribers.delete(cid)
+            continue
+        except Exception:
+            # один підписник не зупиняє розсилку решті
+            logger.exception("scheduled delivery to %s failed", cid)
+        if sub != before:
+            await save_delivery(cid, sub)
+
+async def save_delivery(cid, sub):
+    # пишемо лише поля доставки поверх свіжого запису: поки йшла розсилка,
+    # користувач міг відписатись чи змінити налаштування на іншому воркері
+    current = await subscribers.get(cid)
+    if current is None:
+        return
+    for key in ("last_sent", "last_time", "last_day", "all_sent"):
+        if key in sub:
+            current[key] = sub[key]
+    await subscribers.set(cid, current)
 
-async def favorites_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
-    cid = str(update.effective_chat.id)
-    favs = favorites.get(cid, [])
+async def send_favs_page(ctx, cid, page):
+    favs = await favorites.get(cid)
     if not favs:
-        await update.message.reply_text("У вас ще немає лайків ❤")
+        await ctx.bot.send_message(cid, t(cid, "no_likes"))
+        return
+    total = favs.pages()
+    page = max(0, min(page, total - 1))
+    urls = favs.page(page)
+    if len(urls) == 1:
+        # send_media_group потребує 2–10 елементів
+        await ctx.bot.send_photo(cid, photo=urls[0])
     else:
-        media = [InputMediaPhoto(u) for u in favs[:10]]
-        await ctx.bot.send_media_group(update.effective_chat.id, media)
+        await ctx.bot.send_media_group(cid, [InputMediaPhoto(u) for u in urls])
+    if page + 1 < total:
+        kb = InlineKeyboardMarkup([[
+            InlineKeyboardButton(t(cid, "favs_next"), callback_data=f"FAVS|{page + 1}")
+        ]])
+        await ctx.bot.send_message(cid, t(cid, "favs_page", page=page + 1, total=total), reply_markup=kb)
+
+async def favorites_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    await send_favs_page(ctx, update.effective_chat.id, 0)
 
 async def random_fav_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     cid = str(update.effective_chat.id)
-    favs = favorites.get(cid, [])
+    favs = await favorites.get(cid)
     if not favs:
-        await update.message.reply_text("У вас ще немає лайків ❤")
+        await update.message.reply_text(t(cid, "no_likes"))
     else:
-        url = random.choice(favs)
-        await ctx.bot.send_photo(update.effective_chat.id, photo=url, caption=t(cid, "random_fav_caption"))
+        await ctx.bot.send_photo(update.effective_chat.id, photo=favs.random(), caption=t(cid, "random_fav_caption"))
 
 async def trending_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
-    tag_stats = stats.get("favorites_by_tag", {})
+    tag_stats = await tag_likes.items()
     if not tag_stats:
         await ctx.bot.send_message(cid, t(cid, "no_trending_tags"))
         return
@@ -840,6 +1003,7 @@ async def similar_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Вкажіть тег: /similar <tag>")
         return
     tag = args[0].lower()
+    import difflib
     # Знаходимо схожі теги зі списку CATEGORIES
     similar = [cat for cat in CATEGORIES if cat != tag and (tag in cat or cat in tag)]
     # Якщо мало результатів — додаємо ще за схожістю (Levenshtein/difflib)
@@ -858,11 +1022,10 @@ async def similar_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
 async def stats_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     cid = str(update.effective_chat.id)
-    total_sent = stats.get("images_sent", 0)
-    total_likes = stats.get("favorites_added", 0)
-    favs = favorites.get(cid, [])
-    fav_count = len(favs)
-    tag_stats = stats.get("favorites_by_tag", {})
+    total_sent = await stats.get("images_sent")
+    total_likes = await stats.get("favorites_added")
+    fav_count = await favorites.count(cid)
+    tag_stats = await tag_likes.items()
     if tag_stats:
         top_tag = max(tag_stats.items(), key=lambda x: x[1])
         top_tag_str = f'{top_tag[0]} ({top_tag[1]} разів)'
@@ -877,7 +1040,7 @@ async def stats_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     await ctx.bot.send_message(cid, text)
 
 async def top_today_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
-    top_tags = get_top_tags_by_date(date.today(), limit=3)
+    top_tags = await get_top_tags_by_date(date.today(), limit=3)
     media = []
     keyboard = []
     for tag, count in top_tags:
@@ -893,16 +1056,16 @@ async def top_today_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
 async def like_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     cid = str(update.effective_chat.id)
-    url = last_image.get(update.effective_chat.id)
+    last = sessions.get(cid)
+    url = last["url"] if last else None
+    if last:
+        CACHE_HITS.inc("session")
     if not url:
         await update.message.reply_text(t(cid, "no_image_to_like"))
         return
-    favs = favorites.setdefault(cid, [])
-    if url not in favs:
-        favs.append(url)
-        save_json(FAVS_FILE, favorites)
-        incr("favorites_added")
-        update_achievements(cid, event="like", extra=1)
+    if await favorites.add(cid, url):
+        await stats.incr("favorites_added")
+        achievements.emit(cid, "like")
         await update.message.reply_text(t(cid, "like_added"))
     else:
         await update.message.reply_text(t(cid, "already_liked"))
@@ -915,49 +1078,41 @@ async def category_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(t(update.effective_chat.id, "unknown_tag"))
 
 async def clearstats_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
-    stats["images_sent"] = 0
-    stats["favorites_added"] = 0
-    save_json(STATS_FILE, stats)
+    await stats.clear()
     await update.message.reply_text("Статистика очищена.")
 
 async def clearlike_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     cid = str(update.effective_chat.id)
-    favorites[cid] = []
-    save_json(FAVS_FILE, favorites)
+    await favorites.clear(cid)
     await update.message.reply_text("Ваші лайки очищено.")
 
 async def clearfavorites_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     cid = str(update.effective_chat.id)
-    favorites[cid] = []
-    save_json(FAVS_FILE, favorites)
+    await favorites.clear(cid)
     await update.message.reply_text("Ваші улюbлені очищено.")
 
 async def cleartrendings_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
-    stats["favorites_by_tag"] = {}
-    save_json(STATS_FILE, stats)
+    await tag_likes.clear()
     await update.message.reply_text("Трендові теги очищено.")
 
 async def cleartop_today_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
-    stats["favorites_by_tag_date"] = {}
-    save_json(STATS_FILE, stats)
+    await tag_likes_daily.clear()
     await update.message.reply_text("Топ за сьогодні очищено.")
 
-def get_top_tags_by_date(day, limit=3):
-    tag_stats = stats.get("favorites_by_tag", {})
+async def get_top_tags_by_date(day, limit=3):
+    tag_stats = await tag_likes.items()
     return sorted(tag_stats.items(), key=lambda x: x[1], reverse=True)[:limit]
 
 async def unsubscribe_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     cid = str(update.effective_chat.id)
-    if cid in subscribers:
-        del subscribers[cid]
-        save_json(SUBS_FILE, subscribers)
+    if await subscribers.delete(cid):
         await update.message.reply_text(t(cid, "unsubscribed_hint"))
     else:
         await update.message.reply_text(t(cid, "not_subscribed"))
 
 async def report_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     cid = update.effective_chat.id
-    pending_reports.add(cid)
+    await pending_reports.add(cid)
     if update.message is not None:
         await update.message.reply_text(t(cid, "report_prompt"))
     else:
@@ -965,33 +1120,22 @@ async def report_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
 async def badges_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     cid = str(update.effective_chat.id)
-    user_ach = achievements.get(cid, {})
-    result = []
-    for k, badge_list in BADGES.items():
-        if k == "tags":
-            for tag, name in badge_list:
-                if tag in user_ach.get("tags_used", []):
-                    result.append(name)
-        else:
-            for value, name in badge_list:
-                if user_ach.get(k, 0) >= value:
-                    result.append(name)
+    result = await achievements.badges(cid)
     if result:
-        await update.message.reply_text("Ваші бейджі:\n" + "\n".join(result))
+        await update.message.reply_text(t(cid, "badges_list", badges="\n".join(result)))
     else:
-        await update.message.reply_text("У вас поки немає бейджів 😅")
+        await update.message.reply_text(t(cid, "badges_none"))
 
 async def swap_cmd(update, ctx):
     cid = update.effective_chat.id
-    swap_waiting.add(cid)
-    await ctx.bot.send_message(cid, "Надішліть зображення для обміну.")
+    await swap_waiting.add(cid)
+    await ctx.bot.send_message(cid, t(cid, "swap_send"))
 
 # --- /sendart ---
-sendart_waiting = set()
 
 async def sendart_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     cid = update.effective_chat.id
-    sendart_waiting.add(cid)
+    await sendart_waiting.add(cid)
     text = t(cid, "sendart_prompt")
     if update.message is not None:
         await update.message.reply_text(text)
@@ -1001,104 +1145,68 @@ async def sendart_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 # --- Модерація ---
 async def art_moderation_cb(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
-    data = q.data
-    if data.startswith("ARTAPPROVE") or data.startswith("ARTREJECT"):
-        action, entry_id = data.split("|", 1)
-        # Знайти у pending_arts.json
-        try:
-            with open(PENDING_ARTS_FILE, "r", encoding="utf-8") as f:
-                pending = json.load(f)
-        except Exception:
-            pending = []
-        idx = next((i for i, e in enumerate(pending) if e.get("entry_id") == entry_id), None)
-        if idx is not None:
-            entry = pending.pop(idx)
-            if action == "ARTAPPROVE":
-                entry["status"] = "approved"
-                # Додаємо у user_arts.json
-                try:
-                    with open(USER_ARTS_FILE, "r", encoding="utf-8") as f:
-                        user_arts = json.load(f)
-                except Exception:
-                    user_arts = []
-                user_arts.append(entry)
-                with open(USER_ARTS_FILE, "w", encoding="utf-8") as f:
-                    json.dump(user_arts, f, ensure_ascii=False, indent=2)
-                await ctx.bot.send_message(entry["user_id"], "Ваша картинка схвалена модератором!")
-                await q.edit_message_caption(caption="✅ Картинка схвалена")
+    await q.answer()
+    action, entry_id = q.data.split("|", 1)
+    if action == "ARTAPPROVE":
+        entry = await art_store.approve(entry_id)
     else:
-        entry["status"] = "rejected"
-        await ctx.bot.send_message(entry["user_id"], "Вашу картинку  відхилено модератором.")
+        entry = await art_store.reject(entry_id)
+    if entry is None:
+        # вже оброблено (інший адмін або повторне натискання)
+        await q.edit_message_caption(caption="ℹ️ Вже оброблено")
+        return
+    uid = entry["user_id"]
+    achievements.emit(q.from_user.id, "moderate")
+    if action == "ARTAPPROVE":
+        achievements.emit(uid, "gallery")
+        await ctx.bot.send_message(uid, t(uid, "art_approved"))
+        await q.edit_message_caption(caption="✅ Картинка схвалена")
+    else:
+        await ctx.bot.send_message(uid, t(uid, "art_rejected"))
         await q.edit_message_caption(caption="❌ Картинку відхилено")
-    # Оновити pending_arts.json
-    with open(PENDING_ARTS_FILE, "w", encoding="utf-8") as f:
-        json.dump(pending, f, ensure_ascii=False, indent=2)
 
 # --- /arts ---
 async def arts_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     cid = update.effective_chat.id
-    try:
-        with open(USER_ARTS_FILE, "r", encoding="utf-8") as f:
-            arts = json.load(f)
-    except Exception:
-        arts = []
-    arts = [a for a in arts if a["status"] == "approved" and a["user_id"] != cid]
-    if not arts:
-        await update.message.reply_text(t(cid, "no_user_arts"))
+    art = await art_store.random_approved(exclude_user=cid)
+    if not art:
+        await ctx.bot.send_message(cid, t(cid, "no_user_arts"))
         return
-    import random
-    art = random.choice(arts)
     await ctx.bot.send_photo(cid, photo=art["photo_id"], caption=t(cid, "from_user", user_id=art["user_id"], caption=art["caption"]))
 
 # --- photo_handler ---
-swap_waiting = set()
 
 async def photo_handler(update, ctx):
     cid = update.effective_chat.id
 
     # --- Art Swap ---
-    if cid in swap_waiting:
+    if await swap_waiting.contains(cid):
         photo = update.message.photo[-1].file_id
-        swap_pool[cid] = photo
-        swap_waiting.remove(cid)
-
-        # якщо хтось інший також в пулі
-        for other, img in swap_pool.items():
-            if other != cid:
-                # надсилання один одному
-                await ctx.bot.send_photo(cid, photo=img, caption="🎁 Ось ваш обмін!")
-                await ctx.bot.send_photo(other, photo=photo, caption="🎁 Ось ваш обмін!")
-                del swap_pool[cid], swap_pool[other]
-                return
-
-        await ctx.bot.send_message(cid, "Чекаємо іншого учасника…")
+        await swap_waiting.discard(cid)
+        match, expired = await swap_pool.offer(cid, photo)
+        await notify_swap_expired(expired)
+        if match is None:
+            await ctx.bot.send_message(cid, t(cid, "swap_wait"))
+            return
+        other, img = match
+        # надсилання один одному
+        await ctx.bot.send_photo(cid, photo=img, caption=t(cid, "swap_done"))
+        await ctx.bot.send_photo(other, photo=photo, caption=t(other, "swap_done"))
+        achievements.emit(cid, "swap")
+        achievements.emit(other, "swap")
         return
 
     # --- Надсилання свого арту (модерація) ---
-    if cid in sendart_waiting:
-        sendart_waiting.remove(cid)
+    if await sendart_waiting.contains(cid):
+        await sendart_waiting.discard(cid)
         photo = update.message.photo[-1].file_id
         caption = update.message.caption or ""
-        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        entry_id = str(uuid4())
-        entry = {
-            "entry_id": entry_id,
-            "user_id": cid,
-            "photo_id": photo,
-            "date": now,
-            "caption": caption,
-            "status": "pending"
-        }
-        # Додаємо у pending_arts.json
-        try:
-            with open(PENDING_ARTS_FILE, "r", encoding="utf-8") as f:
-                pending = json.load(f)
-        except Exception:
-            pending = []
-        pending.append(entry)
-        with open(PENDING_ARTS_FILE, "w", encoding="utf-8") as f:
-            json.dump(pending, f, ensure_ascii=False, indent=2)
-        await update.message.reply_text("Вашу картинку надіслано на модерацію!")
+        entry = await art_store.submit(cid, photo, caption)
+        entry_id = entry["entry_id"]
+        await update.message.reply_text(t(cid, "art_sent"))
+        achievements.emit(cid, "send_art")
+        if caption:
+            achievements.emit(cid, "caption")
         # Надіслати адміну на модерацію
         for admin_id in ADMIN_IDS:
             kb = InlineKeyboardMarkup([
@@ -1117,9 +1225,17 @@ async def photo_handler(update, ctx):
 # ——— Реєстрація та запуск ———
 scheduler = AsyncIOScheduler()
 
-def main():
+def build_app():
     global app
-    app = ApplicationBuilder().token(TELEGRAM_TOKEN).post_init(on_startup).build()
+    app = (ApplicationBuilder().token(TELEGRAM_TOKEN)
+           .base_url(f"{TELEGRAM_API_URL}/bot")
+           .base_file_url(f"{TELEGRAM_API_URL}/file/bot")
+           .concurrent_updates(ChatOrderedUpdateProcessor(MAX_IN_FLIGHT, MAX_QUEUED))
+           .request(metrics.instrumented_request())
+           .post_init(on_startup).post_shutdown(on_shutdown).build())
+
+    if RATE_LIMIT:
+        app.add_handler(TypeHandler(Update, throttle), group=-1)
 
     # CommandHandlers
     app.add_handler(CommandHandler("start",      start))
@@ -1145,11 +1261,13 @@ def main():
     app.add_handler(CommandHandler("unsubscribe", unsubscribe_cmd))
     app.add_handler(CommandHandler("report", report_cmd))
     app.add_handler(CommandHandler("badges", badges_cmd))
+    app.add_handler(CommandHandler("swap", swap_cmd))
     app.add_handler(CommandHandler("swap_status", swap_status_cmd))
     app.add_handler(CommandHandler("sendart", sendart_cmd))
     app.add_handler(CommandHandler("arts", arts_cmd))
     app.add_handler(MessageHandler(filters.PHOTO & ~filters.COMMAND, photo_handler))
     app.add_handler(CallbackQueryHandler(art_moderation_cb, pattern=r"^ART(APPROVE|REJECT)"))
+    app.add_handler(CallbackQueryHandler(reports_cb, pattern=r"^REPORTS\|"))
 
     # Inline mode
     app.add_handler(InlineQueryHandler(inline_q))
@@ -1165,14 +1283,111 @@ def main():
         app.add_handler(CommandHandler(cat, category_cmd))
 
     app.add_handler(CommandHandler("active", active_cmd))
+    app.add_handler(CommandHandler("deadtags", deadtags_cmd))
+    app.add_handler(CommandHandler("reports", reports_cmd))
+    app.add_handler(CommandHandler("metrics", metrics_cmd))
+    app.add_handler(CommandHandler("broadcast", broadcast_cmd))
 
     scheduler.add_job(send_scheduled, 'interval', minutes=1)
+    scheduler.add_job(expire_swaps, 'interval', minutes=1)
+    scheduler.add_job(router.flush, 'interval', minutes=1)
+    scheduler.add_job(pool_ring.flush, 'interval', minutes=1)
+    scheduler.add_job(sessions.flush, 'interval', seconds=10)
 
-    logger.info("Bot is running.")
-    app.run_polling()
+    return app
+
+def main():
+    build_app()
+    if BOT_MODE == "webhook":
+        import webhook
+        logger.info("Bot is running (webhook).")
+        asyncio.run(webhook.serve(
+            app, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH,
+            secret=WEBHOOK_SECRET or None, webhook_url=WEBHOOK_URL or None,
+        ))
+    else:
+        logger.info("Bot is running.")
+        app.run_polling()
+
+async def load_state():
+    global viewed
+    viewed, _, _ = await asyncio.gather(
+        asyncio.to_thread(load_json, VIEWED_FILE, {}),
+        asyncio.to_thread(report_log.load),
+        import_legacy(),
+    )
+
+async def import_legacy():
+    # JSON-файли попередніх версій → спільний state, один раз на всі воркери.
+    # Файли не чіпаємо; наявні в state записи не перезаписуються, тож
+    # два воркери, що стартували разом, нічого не задублюють.
+    steps = {
+        "subscribers":  import_subscribers,
+        "favorites":    lambda: import_file(FAVS_FILE, favorites.import_dict),
+        "stats":        lambda: import_file(STATS_FILE, import_stats),
+        "active_users": lambda: import_file(ACTIVE_USERS_FILE, import_active_users),
+        "arts":         lambda: art_store.import_files(PENDING_ARTS_FILE, USER_ARTS_FILE, LEGACY_USER_ARTS_FILE),
+        "achievements": achievements.import_files,
+    }
+    for name, step in steps.items():
+        if await state_backend.sismember("migrated", name):
+            continue
+        await step()
+        await state_backend.sadd("migrated", name)
+
+async def import_file(path, fn):
+    data = await asyncio.to_thread(load_json, path, None)
+    if data:
+        await fn(data)
+
+async def import_subscribers():
+    for cid, sub in (await asyncio.to_thread(load_json, SUBS_FILE, {})).items():
+        await subscribers.setdefault(cid, sub)
+
+async def import_stats(old):
+    for key in ("images_sent", "favorites_added"):
+        if old.get(key):
+            await stats.setdefault(key, old[key])
+    for tag, n in old.get("favorites_by_tag", {}).items():
+        await tag_likes.setdefault(tag, n)
+    for day, tags in old.get("favorites_by_tag_date", {}).items():
+        if isinstance(tags, dict):
+            for tag, n in tags.items():
+                await tag_likes_daily.setdefault(f"{day}|{tag}", n)
+
+async def import_active_users(users):
+    for u in users:
+        # найстаріший формат — просто int
+        u = {"id": u, "username": ""} if isinstance(u, int) else u
+        if isinstance(u, dict) and "id" in u:
+            await active_users.setdefault(u["id"], u)
 
 async def on_startup(app):
+    global blobs
+    await load_state()
+    await asyncio.to_thread(pool_ring.reclaim)
+    await asyncio.to_thread(pool_ring.preload, CATEGORIES)
+    await asyncio.to_thread(router.load)
+    if BLOB_CACHE_DIR:
+        from blobcache import BlobCache
+        blobs = BlobCache(BLOB_CACHE_DIR, BLOB_CACHE_MB * 1024 * 1024)
+        scheduler.add_job(blobs.warm, 'interval', minutes=5)
+    if METRICS_PORT:
+        await metrics.serve(port=METRICS_PORT)
     scheduler.start()
+    achievements.start()
+
+async def on_shutdown(app):
+    pool_ring.release()
+    router.flush()
+    sessions.flush()
+    await persist.flush_all()
+    if achievements:
+        await achievements.stop()
+    if _session is not None:
+        await _session.close()
+    if blobs:
+        blobs.close()
 
 async def langua_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     chat_id = str(update.effective_chat.id)
@@ -1198,8 +1413,20 @@ def is_valid_image_url(url):
         return False
 
 async def swap_status_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text(f"Зараз у черзі: {len(swap_pool)} людей.")
+    cid = update.effective_chat.id
+    await update.message.reply_text(t(cid, "swap_status", count=await swap_pool.size()))
 
+async def expire_swaps():
+    await notify_swap_expired(await swap_pool.expire())
+
+async def notify_swap_expired(cids):
+    for cid in cids:
+        try:
+            await app.bot.send_message(cid, t(cid, "swap_expired"))
+        except Exception as e:
+            logger.warning("swap expire notify %s: %s", cid, e)
+
+@metrics.timed(VALIDATE_LATENCY)
 async def validate_url(url: str) -> bool:
     try:
         timeout = ClientTimeout(total=2)
@@ -1219,32 +1446,127 @@ def require_active_chat(func):
         return await func(update, ctx, *args, **kwargs)
     return wrapper
 
-def load_active_users():
-    if os.path.exists(ACTIVE_USERS_FILE):
-        users = json.load(open(ACTIVE_USERS_FILE, encoding="utf-8"))
-        # Міграція: якщо є int, перетворити на dict
-        users = [
-            {"id": u, "username": ""} if isinstance(u, int) else u
-            for u in users
-        ]
-        # Перезаписати файл у новому форматі
-        json.dump(users, open(ACTIVE_USERS_FILE, "w", encoding="utf-8"), ensure_ascii=False, indent=2)
-        return users
-    return []
+_broadcast_task = None
+
+async def broadcast_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    global _broadcast_task
+    cid = update.effective_chat.id
+    if cid not in ADMIN_IDS:
+        return
+    if _broadcast_task and not _broadcast_task.done():
+        await update.message.reply_text("Broadcast is already running.")
+        return
+    parts = update.message.text.split(maxsplit=1)
+    arg = parts[1].strip() if len(parts) > 1 else ""
+    if not arg:
+        await update.message.reply_text("Usage: /broadcast <text> or /broadcast resume")
+        return
+    if arg == "resume":
+        meta = broadcast.last_unfinished()
+        if not meta:
+            await update.message.reply_text("Nothing to resume.")
+            return
+    else:
+        meta = broadcast.create(arg, cid)
+    status = await update.message.reply_text(f"Broadcast {meta['id']} started…")
+
+    async def progress(m):
+        state = "done" if m["finished"] else "in progress"
+        await status.edit_text(
+            f"Broadcast {m['id']} {state}: sent {m['sent']}, failed {m['failed']}"
+        )
 
-def save_active_users(users):
-    json.dump(users, open(ACTIVE_USERS_FILE, "w", encoding="utf-8"), ensure_ascii=False, indent=2)
+    recipients = broadcast.iter_recipients((await active_users.items()).values(), await subscribers.items())
+    _broadcast_task = asyncio.create_task(broadcast.run(ctx.bot, meta, recipients, progress))
 
-active_users = load_active_users()
+async def metrics_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    cid = update.effective_chat.id
+    if cid not in ADMIN_IDS:
+        return
+    text = metrics.summary() or "No metrics yet."
+    await update.message.reply_text(text[:4000])
 
-async def active_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+async def deadtags_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     cid = update.effective_chat.id
     if cid not in ADMIN_IDS:
         return
-    if os.path.exists(ACTIVE_USERS_FILE):
-        users = json.load(open(ACTIVE_USERS_FILE, encoding="utf-8"))
+    top = neg_top(20)
+    if not top:
+        await update.message.reply_text("Dead tags: —")
+        return
+    lines = ["Dead tags (blocked lookups):"]
+    for i, (tag, count) in enumerate(top, 1):
+        lines.append(f"{i}. {tag} ({count})")
+    await update.message.reply_text("\n".join(lines))
+
+def reports_page(who, page):
+    # who: "all" або user_id; повертає (текст, клавіатура)
+    user_id = None if who == "all" else int(who)
+    total = report_log.pages(user_id)
+    if user_id is None:
+        entries = report_log.recent(page)
+        title = f"Reports: {len(report_log)} total, {report_log.since(time.time() - 86400)} in 24h"
     else:
-        users = []
+        entries = report_log.by_user(user_id, page)
+        title = f"Reports from {user_id}"
+    if not entries:
+        return f"{title}\n—", None
+    lines = [f"{title} (page {page + 1}/{total})"]
+    for r in entries:
+        line = f"[{r.get('timestamp', '')}] {r.get('username', '')} ({r.get('user_id')}): {r.get('text') or ''}"
+        if r.get("image"):
+            line += f"\n   🖼 {r.get('tag') or ''} {r['image']}"
+        lines.append(line)
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton("⬅️", callback_data=f"REPORTS|{who}|{page - 1}"))
+    if page + 1 < total:
+        buttons.append(InlineKeyboardButton("➡️", callback_data=f"REPORTS|{who}|{page + 1}"))
+    markup = InlineKeyboardMarkup([buttons]) if buttons else None
+    return "\n".join(lines)[:4000], markup
+
+async def reports_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    # /reports [page] | /reports user <id> [page] | /reports images
+    cid = update.effective_chat.id
+    if cid not in ADMIN_IDS:
+        return
+    args = ctx.args or []
+    if args and args[0] == "images":
+        storms = report_log.storms(20)
+        if not storms:
+            await update.message.reply_text("Reported images: —")
+            return
+        lines = ["Most reported images:"]
+        for i, (url, g) in enumerate(storms, 1):
+            when = datetime.fromtimestamp(g["last"]).strftime("%Y-%m-%d %H:%M")
+            lines.append(f"{i}. {g['count']} reports / {len(g['users'])} users, last {when}, {g.get('tag') or ''}\n   {url}")
+        await update.message.reply_text("\n".join(lines)[:4000])
+        return
+    try:
+        if args and args[0] == "user":
+            who, page = str(int(args[1])), int(args[2]) - 1 if len(args) > 2 else 0
+        else:
+            who, page = "all", int(args[0]) - 1 if args else 0
+    except (IndexError, ValueError):
+        await update.message.reply_text("Usage: /reports [page] | /reports user <id> [page] | /reports images")
+        return
+    text, markup = reports_page(who, max(page, 0))
+    await update.message.reply_text(text, reply_markup=markup)
+
+async def reports_cb(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    q = update.callback_query
+    await q.answer()
+    if q.message.chat.id not in ADMIN_IDS:
+        return
+    _, who, page = q.data.split("|")
+    text, markup = reports_page(who, int(page))
+    await q.edit_message_text(text, reply_markup=markup)
+
+async def active_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    cid = update.effective_chat.id
+    if cid not in ADMIN_IDS:
+        return
+    users = (await active_users.items()).values()
     # Створюємо словник, щоб залишити лише унікальні id
     unique = {}
     for u in users:
@@ -1260,26 +1582,16 @@ async def active_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         lines.append(f"{uname} {u['id']}  first: {first}  last: {last}")
     await update.message.reply_text('\n'.join(lines))
 
-def add_active_user(cid, username, users):
+async def add_active_user(cid, username):
     now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    found = False
-    for u in users:
-        if u.get("id") == cid:
-            u["last"] = now
-            u["username"] = username or u.get("username", "")
-            found = True
-            break
-    if not found:
-        users.append({
-            "id": cid,
-            "username": username or "",
-            "first": now,
-            "last": now
-        })
-    json.dump(users, open(ACTIVE_USERS_FILE, "w", encoding="utf-8"), ensure_ascii=False, indent=2)
-
-def is_user_active(cid, users):
-    return any(u["id"] == cid for u in users)
+    u = await active_users.get(cid) or {"id": cid, "username": ""}
+    u.setdefault("first", now)
+    u["last"] = now
+    u["username"] = username or u.get("username", "")
+    await active_users.set(cid, u)
+
+async def is_user_active(cid):
+    return await active_users.contains(cid)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,110 @@
+import os, json, asyncio, logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR          = os.path.join(os.path.dirname(__file__), "data")
+ACHIEVEMENTS_FILE = os.path.join(DATA_DIR, "data_achievements.json")
+COUNTERS_FILE     = os.path.join(DATA_DIR, "data_achievement_counters.json")
+
+QUEUE_MAX = 10_000  # події понад це відкидаються, хендлери не чекають
+
+# Правила, згруповані за типом події: (вид, поріг, бейдж)
+#   "count" — скільки разів користувач уже надіслав цю подію
+#   "value" — значення extra, яке передала подія
+RULES = {
+    "send_art":   [("count", 1, "🎨 Перша картинка")],
+    "like":       [("count", 1, "👍 Перший лайк")],
+    "view_art":   [("count", 10, "👀 10 картинок"),
+                   ("count", 50, "👁 50 картинок"),
+                   ("count", 100, "🧿 100 картинок")],
+    "all_tag":    [("count", 1, "🏆 Колекціонер")],
+    "swap":       [("count", 1, "🔄 Перший обмін")],
+    "moderate":   [("count", 1, "🛡️ Модератор")],
+    "gallery":    [("count", 5, "🖼 Галерист")],
+    "trend":      [("value", 10, "🔥 Творець тренду")],
+    "favorite":   [("value", 50, "🌟 Улюбленець")],
+    "multigenre": [("value", 5, "🎭 Мультижанр")],
+    "tagmaster":  [("value", 3, "🏷️ Тег-майстер")],
+    "caption":    [("count", 1, "✍️ Перший коментар")],
+    "early":      [("count", 1, "🌅 Ранній птах")],
+    "night":      [("count", 1, "🌙 Нічна сова")],
+    "dailyfan":   [("value", 7, "📅 Щоденний фан")],
+    "secret":     [("count", 1, "🕵️‍♂️ Секретний тег")],
+    "meme":       [("count", 1, "😂 Мем-майстер")],
+}
+
+
+def _load(path, default):
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    return default
+
+
+class AchievementEngine:
+    # Лічильники й нагороди — у спільному state-бекенді, по хешу на чат:
+    #   ach_counts:<cid> — подія → n (атомарний hincr)
+    #   ach_awards:<cid> — бейдж → дата (hsetnx, тож бейдж дається раз)
+    # Хендлери лише кладуть подію в чергу; пише її окрема задача.
+    def __init__(self, backend):
+        self.backend = backend
+        self._queue = asyncio.Queue(maxsize=QUEUE_MAX)
+        self._task = None
+
+    # ——— API для хендлерів ———
+    def emit(self, cid, event, extra=None):
+        if event not in RULES:
+            return
+        try:
+            self._queue.put_nowait((str(cid), event, extra))
+        except asyncio.QueueFull:
+            logger.warning("achievements queue full, dropping %s", event)
+
+    async def badges(self, cid):
+        awards = await self.backend.hgetall(f"ach_awards:{cid}")
+        return [name for name, _ in sorted(awards.items(), key=lambda x: x[1])]
+
+    # ——— Споживач ———
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._consume())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        while not self._queue.empty():
+            await self._apply(*self._queue.get_nowait())
+
+    async def _consume(self):
+        while True:
+            item = await self._queue.get()
+            try:
+                await self._apply(*item)
+            except Exception:
+                logger.exception("achievement %s failed", item[1])
+
+    async def _apply(self, cid, event, extra):
+        count = await self.backend.hincr(f"ach_counts:{cid}", event)
+        for kind, threshold, name in RULES[event]:
+            value = count if kind == "count" else (extra or 0)
+            if value >= threshold:
+                await self._award(cid, name)
+
+    async def _award(self, cid, name, date=None):
+        date = date or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        await self.backend.hset(f"ach_awards:{cid}", name, date, only_new=True)
+
+    async def import_files(self):
+        # data_achievements*.json попередніх версій → state; наявне не перезаписується
+        awards, counters = await asyncio.gather(
+            asyncio.to_thread(_load, ACHIEVEMENTS_FILE, {}),
+            asyncio.to_thread(_load, COUNTERS_FILE, {}),
+        )
+        for cid, lst in awards.items():
+            for a in lst:
+                await self._award(cid, a["achievement"], a.get("date"))
+        for cid, counts in counters.items():
+            for event, n in counts.items():
+                await self.backend.hset(f"ach_counts:{cid}", event, str(n), only_new=True)
@@ -0,0 +1,92 @@
+import os, json, random, asyncio
+from datetime import datetime
+from uuid import uuid4
+
+from persist import Journal
+from state import SharedDict, SharedCounter
+
+RANDOM_TRIES = 8  # випадкових записів за раз до повного перебору
+
+
+def _load(path):
+    if os.path.exists(path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            pass
+    return []
+
+
+class ArtStore:
+    # Модерація користувацьких артів у спільному state-бекенді: черга
+    # модерації і схвалені — хеші entry_id → запис, тож кнопку адміна
+    # може обробити будь-який воркер. Запис забирається з черги одним
+    # атомарним hdel — лише один воркер його схвалить чи відхилить.
+    def __init__(self, backend):
+        self.pending = SharedDict(backend, "arts_pending")
+        self.approved = SharedDict(backend, "arts_approved")
+        self._owned = SharedCounter(backend, "arts_owned")  # user_id → скільки схвалених
+
+    async def get(self, entry_id):
+        return await self.pending.get(entry_id)
+
+    async def submit(self, user_id, photo_id, caption):
+        entry = {
+            "entry_id": str(uuid4()),
+            "user_id": user_id,
+            "photo_id": photo_id,
+            "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "caption": caption,
+            "status": "pending",
+        }
+        await self.pending.set(entry["entry_id"], entry)
+        return entry
+
+    async def approve(self, entry_id):
+        # None — запис уже оброблено (наприклад, іншим адміном)
+        entry = await self._take(entry_id)
+        if entry is None:
+            return None
+        entry["status"] = "approved"
+        await self._add_approved(entry)
+        return entry
+
+    async def reject(self, entry_id):
+        entry = await self._take(entry_id)
+        if entry is None:
+            return None
+        entry["status"] = "rejected"
+        return entry
+
+    async def random_approved(self, exclude_user=None):
+        others = await self.approved.size() - await self._owned.get(exclude_user)
+        if others <= 0:
+            return None
+        for entry in await self.approved.random(RANDOM_TRIES):
+            if entry["user_id"] != exclude_user:
+                return entry
+        # сюди потрапляємо лише коли більшість артів — самого користувача
+        others = [e for e in (await self.approved.items()).values() if e["user_id"] != exclude_user]
+        return random.choice(others) if others else None
+
+    async def import_files(self, pending_path, approved_path, legacy_approved_path=None):
+        # файли попередніх версій → state; повторний імпорт нічого не дублює
+        journal = Journal(approved_path)
+        approved = await asyncio.to_thread(lambda: list(journal) + _load(legacy_approved_path or ""))
+        for e in approved:
+            if e.get("status") == "approved":
+                await self._add_approved(e)
+        for e in await asyncio.to_thread(_load, pending_path):
+            if e.get("status") == "pending" and not await self.approved.contains(e["entry_id"]):
+                await self.pending.setdefault(e["entry_id"], e)
+
+    async def _take(self, entry_id):
+        entry = await self.pending.get(entry_id)
+        if entry is None or not await self.pending.delete(entry_id):
+            return None
+        return entry
+
+    async def _add_approved(self, entry):
+        if await self.approved.setdefault(entry["entry_id"], entry):
+            await self._owned.incr(entry["user_id"])
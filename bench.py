@@ -0,0 +1,312 @@
+import os, sys, json, time, random, shutil, asyncio, argparse, builtins, tempfile
+from collections import Counter as Tally
+
+from aiohttp import web
+
+# Офлайн-бенчмарк: локальний aiohttp-сервер підміняє danbooru, safebooru,
+# konachan, wallhaven, waifu.pics і Telegram Bot API. Бот запускається з
+# тимчасової копії модулів, тож справжні data/ та cache.db не чіпаються.
+#
+#   python bench.py --users 50 --tags 20 --latency 80 --fail-rate 0.05
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+TOKEN = "1:bench"
+
+
+# ——— Фейкові апстріми ———
+class FakeUpstream:
+    def __init__(self, latency_ms=50, jitter_ms=20, fail_rate=0.0, empty_rate=0.0, seed=1):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.fail_rate = fail_rate
+        self.empty_rate = empty_rate
+        self.rng = random.Random(seed)
+        self.calls = Tally()
+        self.base = None
+        self._msg_id = 0
+
+    async def _delay(self, kind):
+        self.calls[kind] += 1
+        await asyncio.sleep(self.latency + self.rng.random() * self.jitter)
+        if self.rng.random() < self.fail_rate:
+            raise web.HTTPInternalServerError()
+        return self.rng.random() >= self.empty_rate
+
+    def _img(self, prefix, i):
+        return f"{self.base}/img/{prefix}-{i}-{self.rng.getrandbits(32):08x}.jpg"
+
+    def _posts(self, request, prefix, has):
+        n = min(int(request.query.get("limit", 1)), 100) if has else 0
+        return [{
+            "file_url": self._img(prefix, i), "md5": f"{self.rng.getrandbits(128):032x}",
+            "image_width": 1200, "image_height": 900, "width": 1200, "height": 900,
+            "file_size": 400_000, "file_ext": "jpg", "tag_string": "bench", "rating": "s",
+        } for i in range(n)]
+
+    async def danbooru(self, request):
+        return web.json_response(self._posts(request, "dan", await self._delay("danbooru")))
+
+    async def konachan(self, request):
+        return web.json_response(self._posts(request, "kon", await self._delay("konachan")))
+
+    async def safebooru(self, request):
+        posts = self._posts(request, "safe", await self._delay("safebooru"))
+        body = "".join(
+            f'<post file_url="{p["file_url"]}" md5="{p["md5"]}" width="{p["width"]}" '
+            f'height="{p["height"]}" tags="bench" rating="s"/>' for p in posts)
+        return web.Response(text=f'<?xml version="1.0"?><posts>{body}</posts>',
+                            content_type="application/xml")
+
+    async def wallhaven(self, request):
+        has = await self._delay("wallhaven")
+        data = [{"path": self._img("wh", i), "dimension_x": 1920, "dimension_y": 1080,
+                 "file_size": 900_000, "file_type": "image/jpeg"} for i in range(24 if has else 0)]
+        return web.json_response({"data": data})
+
+    async def waifu(self, request):
+        await self._delay("waifu.pics")
+        return web.json_response({"url": self._img("waifu", 0)})
+
+    async def image(self, request):
+        self.calls["image"] += 1
+        return web.Response(body=b"\xff\xd8\xff\xd9", content_type="image/jpeg")
+
+    async def telegram(self, request):
+        method = request.match_info["method"]
+        self.calls[f"tg:{method}"] += 1
+        await asyncio.sleep(self.latency / 2)
+        self._msg_id += 1
+        chat = {"id": 1, "type": "private"}
+        try:
+            data = await request.post()
+            chat["id"] = int(data.get("chat_id", 1))
+        except Exception:
+            pass
+        result = {"message_id": self._msg_id, "date": int(time.time()), "chat": chat}
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        elif method in ("sendChatAction", "deleteMessage", "answerInlineQuery",
+                        "answerCallbackQuery", "setWebhook"):
+            result = True
+        elif method == "sendPhoto":
+            result["photo"] = [{"file_id": f"f{self._msg_id}", "file_unique_id": f"u{self._msg_id}",
+                                "width": 90, "height": 90}]
+        elif method == "sendMediaGroup":
+            result = [result]
+        return web.json_response({"ok": True, "result": result})
+
+    async def start(self, port=0):
+        app = web.Application()
+        app.router.add_get("/danbooru/posts.json", self.danbooru)
+        app.router.add_get("/konachan/post.json", self.konachan)
+        app.router.add_get("/safebooru/index.php", self.safebooru)
+        app.router.add_get("/wallhaven/api/v1/search", self.wallhaven)
+        app.router.add_get("/waifu/sfw/{tag}", self.waifu)
+        app.router.add_route("*", "/img/{name}", self.image)
+        app.router.add_post("/bot{token}/{method}", self.telegram)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base = f"http://127.0.0.1:{port}"
+        return self.base
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+# ——— Лічильники I/O ———
+class IOCounter:
+    def __init__(self):
+        self.db = 0
+        self.file_reads = 0
+        self.file_writes = 0
+        self._open = builtins.open
+
+    def install(self, db):
+        db.set_trace_callback(self._on_sql)
+        counter = self
+
+        def counting_open(file, mode="r", *a, **kw):
+            if isinstance(file, (str, os.PathLike)) and str(file).endswith((".json", ".jsonl", ".sent", ".tmp")):
+                if any(c in mode for c in "wax+"):
+                    counter.file_writes += 1
+                else:
+                    counter.file_reads += 1
+            return counter._open(file, mode, *a, **kw)
+
+        builtins.open = counting_open
+
+    def _on_sql(self, stmt):
+        self.db += 1
+
+    def reset(self):
+        self.db = self.file_reads = self.file_writes = 0
+
+    def uninstall(self):
+        builtins.open = self._open
+
+
+# ——— Допоміжне ———
+def percentiles(samples):
+    if not samples:
+        return {"p50": 0, "p95": 0, "p99": 0}
+    s = sorted(samples)
+    pick = lambda q: s[min(len(s) - 1, int(q * len(s)))] * 1000
+    return {"p50": round(pick(0.50), 1), "p95": round(pick(0.95), 1), "p99": round(pick(0.99), 1)}
+
+async def measure(name, jobs, concurrency, io, upstream, drain=None):
+    sem = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+    before = sum(upstream.calls.values())
+    io.reset()
+
+    async def one(job):
+        nonlocal errors
+        async with sem:
+            start = time.perf_counter()
+            try:
+                await job()
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(j) for j in jobs))
+    elapsed = time.perf_counter() - start
+    if drain:
+        # фонові prefetch, запущені сценарієм, рахуємо в його I/O
+        await drain()
+    return {
+        "scenario": name,
+        "ops": len(jobs),
+        "errors": errors,
+        "throughput": round(len(jobs) / elapsed, 1) if elapsed else 0,
+        **percentiles(latencies),
+        "upstream_calls": sum(upstream.calls.values()) - before,
+        "db_statements": io.db,
+        "file_reads": io.file_reads,
+        "file_writes": io.file_writes,
+    }
+
+def sandbox():
+    # тимчасова копія модулів бота, щоб data/ і cache.db були одноразові
+    tmp = tempfile.mkdtemp(prefix="tyanpic-bench-")
+    for name in os.listdir(ROOT):
+        if name.endswith(".py") and name != "bench.py":
+            shutil.copy(os.path.join(ROOT, name), tmp)
+    return tmp
+
+
+# ——— Сценарії ———
+async def run(args):
+    upstream = FakeUpstream(args.latency, args.jitter, args.fail_rate, args.empty_rate)
+    base = await upstream.start()
+    tmp = sandbox()
+    os.environ.update({
+        "TELEGRAM_TOKEN": TOKEN, "WALLHAVEN_API_KEY": "bench",
+        "TELEGRAM_API_URL": base,
+        "DANBOORU_URL": f"{base}/danbooru", "SAFEBOORU_URL": f"{base}/safebooru",
+        "KONACHAN_URL": f"{base}/konachan", "WALLHAVEN_URL": f"{base}/wallhaven",
+        "WAIFU_PICS_URL": f"{base}/waifu",
+    })
+    os.chdir(tmp)
+    sys.path.insert(0, tmp)
+
+    import TyanPic as bot
+    from telegram import Update
+    from telegram.ext import CallbackContext
+
+    io = IOCounter()
+    io.install(bot.DB)
+    app = bot.build_app()
+    await app.initialize()
+    await bot.load_state()
+
+    drain = bot.drain_prefetch
+    rng = random.Random(2)
+    tags = [f"tag{i}" for i in range(args.tags)] + bot.CATEGORIES[:min(args.tags, 8)]
+    users = list(range(1000, 1000 + args.users))
+
+    def message_update(cid, text, uid=[0]):
+        uid[0] += 1
+        return Update.de_json({"update_id": uid[0], "message": {
+            "message_id": uid[0], "date": int(time.time()), "text": text,
+            "chat": {"id": cid, "type": "private"},
+            "from": {"id": cid, "is_bot": False, "first_name": "U"}}}, app.bot)
+
+    def inline_update(cid, query, uid=[10**6]):
+        uid[0] += 1
+        return Update.de_json({"update_id": uid[0], "inline_query": {
+            "id": str(uid[0]), "query": query, "offset": "",
+            "from": {"id": cid, "is_bot": False, "first_name": "U"}}}, app.bot)
+
+    def ctx_for(update):
+        return CallbackContext.from_update(update, app)
+
+    results = []
+    n = args.users * args.requests
+
+    jobs = [lambda t=rng.choice(tags): bot.fetch_image(t) for _ in range(n)]
+    results.append(await measure("fetch_image", jobs, args.concurrency, io, upstream, drain))
+
+    def on_tag_job(cid, tag):
+        async def job():
+            u = message_update(cid, tag)
+            await bot.on_tag(u, ctx_for(u), tag)
+        return job
+    jobs = [on_tag_job(rng.choice(users), rng.choice(tags)) for _ in range(n)]
+    results.append(await measure("on_tag", jobs, args.concurrency, io, upstream, drain))
+
+    jobs = [lambda t=t: asyncio.to_thread(bot.prefetch, t, 60) for t in tags[:args.tags]]
+    results.append(await measure("prefetch", jobs, 4, io, upstream, drain))
+
+    def inline_job(cid, tag):
+        async def job():
+            u = inline_update(cid, tag)
+            await bot.inline_q(u, ctx_for(u))
+        return job
+    jobs = [inline_job(rng.choice(users), rng.choice(tags)) for _ in range(n)]
+    results.append(await measure("inline_q", jobs, args.concurrency, io, upstream, drain))
+
+    for cid in users:
+        await bot.subscribers.set(str(cid), {"interval": 1, "count": 1, "hour": None, "last_time": 0})
+    results.append(await measure("send_scheduled", [bot.send_scheduled], 1, io, upstream, drain))
+
+    await drain()
+    io.uninstall()
+    await bot.on_shutdown(app)
+    await app.shutdown()
+    await upstream.stop()
+    shutil.rmtree(tmp, ignore_errors=True)
+    return results, dict(upstream.calls)
+
+
+def main():
+    p = argparse.ArgumentParser(description="Offline TyanPic benchmark")
+    p.add_argument("--users", type=int, default=20)
+    p.add_argument("--tags", type=int, default=10)
+    p.add_argument("--requests", type=int, default=3, help="requests per user per scenario")
+    p.add_argument("--concurrency", type=int, default=16)
+    p.add_argument("--latency", type=float, default=50, help="upstream latency, ms")
+    p.add_argument("--jitter", type=float, default=20, help="extra random latency, ms")
+    p.add_argument("--fail-rate", type=float, default=0.0)
+    p.add_argument("--empty-rate", type=float, default=0.1, help="share of empty search results")
+    p.add_argument("--json", action="store_true", help="print raw JSON")
+    args = p.parse_args()
+
+    results, calls = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps({"results": results, "upstream": calls}, indent=2))
+        return
+    cols = ["scenario", "ops", "errors", "throughput", "p50", "p95", "p99",
+            "upstream_calls", "db_statements", "file_reads", "file_writes"]
+    print("  ".join(f"{c:>14}" for c in cols))
+    for r in results:
+        print("  ".join(f"{r[c]:>14}" for c in cols))
+    print("\nupstream calls:", ", ".join(f"{k}={v}" for k, v in sorted(calls.items())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import os, asyncio, logging
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import aiohttp
+
+from cache import DB, DB_LOCK
+
+logger = logging.getLogger(__name__)
+
+# Локальний кеш картинок із пулу, адресований md5. Оригінал не зберігаємо —
+# лише варіанти, які влазять у ліміти Telegram:
+#   photo — довша сторона ≤ 1280, JPEG
+VARIANTS      = {"photo": 1280}
+MAX_DOWNLOAD  = 50 * 1024 * 1024
+WARM_PARALLEL = 4
+
+
+def make_variants(data):
+    # виконується в окремому процесі
+    import io
+    from PIL import Image
+    out = {}
+    img = Image.open(io.BytesIO(data))
+    img.seek(0)
+    img = img.convert("RGB")
+    for name, side in VARIANTS.items():
+        v = img.copy()
+        v.thumbnail((side, side))
+        buf = io.BytesIO()
+        v.save(buf, "JPEG", quality=85, optimize=True)
+        out[name] = buf.getvalue()
+    return out
+
+
+class BlobCache:
+    def __init__(self, root, max_bytes, workers=2):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self._pool = None
+        self._lru = OrderedDict()  # md5 → байтів на диску (усі варіанти)
+        self._size = 0
+        self._inflight = set()
+        os.makedirs(root, exist_ok=True)
+        self._scan()
+
+    def path(self, md5, variant="photo"):
+        return os.path.join(self.root, md5[:2], f"{md5}.{variant}.jpg")
+
+    def get(self, md5, variant="photo"):
+        if md5 not in self._lru:
+            return None
+        p = self.path(md5, variant)
+        if not os.path.exists(p):  # недописаний варіант після збою
+            self._size -= self._lru.pop(md5)
+            return None
+        self._lru.move_to_end(md5)
+        return p
+
+    def __len__(self):
+        return len(self._lru)
+
+    async def fetch(self, md5, url, session):
+        if md5 in self._lru or md5 in self._inflight:
+            return
+        self._inflight.add(md5)
+        try:
+            async with session.get(url, timeout=aiohttp.ClientTimeout(total=60)) as r:
+                if r.status != 200 or (r.content_length or 0) > MAX_DOWNLOAD:
+                    return
+                data = bytearray()
+                async for chunk in r.content.iter_chunked(256 * 1024):
+                    data += chunk
+                    if len(data) > MAX_DOWNLOAD:
+                        return
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(self.workers)
+            loop = asyncio.get_running_loop()
+            variants = await loop.run_in_executor(self._pool, make_variants, bytes(data))
+            size = 0
+            for name, blob in variants.items():
+                p = self.path(md5, name)
+                os.makedirs(os.path.dirname(p), exist_ok=True)
+                with open(p + ".tmp", "wb") as f:
+                    f.write(blob)
+                os.replace(p + ".tmp", p)
+                size += len(blob)
+            self._lru[md5] = size
+            self._size += size
+            self._evict()
+        except Exception as e:
+            logger.debug("blob %s: %s", url, e)
+        finally:
+            self._inflight.discard(md5)
+
+    async def warm(self, limit=100):
+        # докачуємо ще не закешовані невикористані картинки з пулу
+        with DB_LOCK:
+            rows = DB.execute(
+                "SELECT md5, url FROM image_pool WHERE used=0 AND md5 IS NOT NULL "
+                "AND coalesce(ext, '') != 'gif' "
+                "ORDER BY fetched DESC LIMIT ?", (limit * 4,)
+            ).fetchall()
+        rows = [r for r in rows if r[0] not in self._lru][:limit]
+        if not rows:
+            return 0
+        sem = asyncio.Semaphore(WARM_PARALLEL)
+        async with aiohttp.ClientSession() as session:
+            async def one(md5, url):
+                async with sem:
+                    await self.fetch(md5, url, session)
+            await asyncio.gather(*(one(m, u) for m, u in rows))
+        return len(rows)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _evict(self):
+        while self._size > self.max_bytes and self._lru:
+            md5, size = self._lru.popitem(last=False)
+            self._size -= size
+            for name in VARIANTS:
+                try:
+                    os.remove(self.path(md5, name))
+                except FileNotFoundError:
+                    pass
+
+    def _scan(self):
+        # відновлюємо LRU після рестарту: порядок — за часом зміни файлу
+        found = {}
+        for sub in os.listdir(self.root):
+            d = os.path.join(self.root, sub)
+            if not os.path.isdir(d):
+                continue
+            for name in os.listdir(d):
+                if not name.endswith(".jpg"):
+                    continue
+                md5, variant, _ = name.split(".", 2)
+                if variant not in VARIANTS:  # варіант, який більше не робимо (thumb)
+                    os.remove(os.path.join(d, name))
+                    continue
+                st = os.stat(os.path.join(d, name))
+                size, mtime = found.get(md5, (0, 0))
+                found[md5] = (size + st.st_size, max(mtime, st.st_mtime))
+        for md5, (size, _) in sorted(found.items(), key=lambda x: x[1][1]):
+            self._lru[md5] = size
+            self._size += size
+        self._evict()
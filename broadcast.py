@@ -0,0 +1,185 @@
+import os, json, time, asyncio, logging
+from uuid import uuid4
+
+from telegram.error import RetryAfter, Forbidden, BadRequest
+
+from persist import atomic_write
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_DIR = os.path.join(os.path.dirname(__file__), "data", "broadcast")
+
+GLOBAL_RATE    = 25    # повідомлень/сек на всього бота (ліміт Telegram ~30)
+CONCURRENCY    = 20    # одночасних send_message
+MAX_RETRIES    = 3     # скільки разів повторюємо після RetryAfter
+PROGRESS_EVERY = 5.0   # як часто оновлюємо прогрес адміну (сек)
+
+# Кожен чат отримує рівно одне повідомлення на розсилку, тому ліміт
+# «1 повідомлення/сек на чат» виконується сам собою — стежимо лише за
+# глобальним темпом і RetryAfter.
+
+
+class RateLimiter:
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            now = loop.time()
+            if self._next > now:
+                await asyncio.sleep(self._next - now)
+                now = loop.time()
+            self._next = max(now, self._next) + self.interval
+
+    def pause(self, seconds):
+        # RetryAfter — зупиняємо весь потік, а не тільки один воркер
+        now = asyncio.get_running_loop().time()
+        self._next = max(self._next, now + seconds)
+
+
+def _retry_seconds(e):
+    ra = e.retry_after
+    return ra.total_seconds() if hasattr(ra, "total_seconds") else float(ra)
+
+
+# ——— Checkpoint: meta.json + append-only список оброблених chat_id ———
+def _meta_path(bid):
+    return os.path.join(BROADCAST_DIR, f"{bid}.json")
+
+def _log_path(bid):
+    return os.path.join(BROADCAST_DIR, f"{bid}.sent")
+
+def _save_meta(meta):
+    atomic_write(_meta_path(meta["id"]), meta)
+
+def _load_done(bid):
+    done = set()
+    if os.path.exists(_log_path(bid)):
+        with open(_log_path(bid), encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line.lstrip("-").isdigit():
+                    done.add(int(line))
+    return done
+
+def create(text, admin_id):
+    os.makedirs(BROADCAST_DIR, exist_ok=True)
+    meta = {
+        "id": uuid4().hex[:12],
+        "text": text,
+        "admin_id": admin_id,
+        "started": int(time.time()),
+        "sent": 0,
+        "failed": 0,
+        "finished": False,
+    }
+    _save_meta(meta)
+    return meta
+
+def last_unfinished():
+    if not os.path.isdir(BROADCAST_DIR):
+        return None
+    metas = []
+    for name in os.listdir(BROADCAST_DIR):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(BROADCAST_DIR, name), encoding="utf-8") as f:
+                meta = json.load(f)
+        except Exception:
+            continue
+        if not meta.get("finished"):
+            metas.append(meta)
+    return max(metas, key=lambda m: m["started"]) if metas else None
+
+
+def iter_recipients(active_users, subscribers):
+    # Потоково, без побудови загального списку; дублікати відсікаємо
+    seen = set()
+    for u in active_users:
+        cid = u.get("id") if isinstance(u, dict) else u
+        if isinstance(cid, int) and cid not in seen:
+            seen.add(cid)
+            yield cid
+    for cid in subscribers:
+        try:
+            cid = int(cid)
+        except (TypeError, ValueError):
+            continue
+        if cid not in seen:
+            seen.add(cid)
+            yield cid
+
+
+async def run(bot, meta, recipients, progress=None,
+              rate=GLOBAL_RATE, concurrency=CONCURRENCY):
+    bid = meta["id"]
+    done = _load_done(bid)
+    limiter = RateLimiter(rate)
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    log = open(_log_path(bid), "a", encoding="utf-8")
+
+    async def send(cid):
+        for _ in range(MAX_RETRIES + 1):
+            await limiter.acquire()
+            try:
+                await bot.send_message(cid, meta["text"])
+                return True
+            except RetryAfter as e:
+                limiter.pause(_retry_seconds(e))
+            except (Forbidden, BadRequest):
+                return False  # заблокував бота / чат не існує
+            except Exception as e:
+                logger.warning("broadcast %s: %s → %s", bid, cid, e)
+                return False
+        return False
+
+    async def worker():
+        while True:
+            cid = await queue.get()
+            try:
+                if await send(cid):
+                    meta["sent"] += 1
+                else:
+                    meta["failed"] += 1
+                # фіксуємо і невдалі, щоб resume їх не повторював
+                log.write(f"{cid}\n")
+                log.flush()
+            finally:
+                queue.task_done()
+
+    async def reporter():
+        while True:
+            await asyncio.sleep(PROGRESS_EVERY)
+            _save_meta(meta)
+            await _report(progress, meta)
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    rep = asyncio.create_task(reporter())
+    try:
+        for cid in recipients:
+            if cid in done:
+                continue
+            await queue.put(cid)
+        await queue.join()
+        meta["finished"] = True
+    finally:
+        for w in workers:
+            w.cancel()
+        rep.cancel()
+        log.close()
+        _save_meta(meta)
+    await _report(progress, meta)
+    return meta
+
+
+async def _report(progress, meta):
+    if not progress:
+        return
+    try:
+        await progress(meta)
+    except Exception as e:
+        logger.warning("broadcast progress: %s", e)
@@ -1,48 +1,298 @@
-import sqlite3, time
+import sqlite3, time, threading
+from collections import OrderedDict
+from itertools import islice
 
 DB = sqlite3.connect("cache.db", check_same_thread=False)
 CUR = DB.cursor()
-CUR.execute("""
-CREATE TABLE IF NOT EXISTS image_pool(
-    tag TEXT,
-    url TEXT,
-    api TEXT,
-    md5 TEXT,
-    used INT DEFAULT 0,
-    fetched INT,
-    PRIMARY KEY(tag, url)
-)
-""")
-CUR.execute("""
-CREATE TABLE IF NOT EXISTS seen(
-    chat_id TEXT,
-    url TEXT,
-    PRIMARY KEY(chat_id, url)
-)
-""")
-DB.commit()
-
-async def fetch_image(tag):
-    return None, None
-
-import requests, hashlib, time
-
-async def prefetch(tag, n=100):
-    # Danbooru
-    url = f"https://danbooru.donmai.us/posts.json?tags={tag}&limit={n}"
-    resp = requests.get(url)
-    for post in resp.json():
-        img_url = post.get("file_url")
-        md5 = post.get("md5")
-        if not img_url or not md5:
-            continue
-        # Перевірка на дублі
-        CUR.execute("SELECT 1 FROM image_pool WHERE md5=?", (md5,))
-        if CUR.fetchone():
-            continue
-        CUR.execute(
-            "INSERT OR IGNORE INTO image_pool(tag, url, api, md5, used, fetched) VALUES (?, ?, ?, ?, 0, ?)",
-            (tag, img_url, "danbooru", md5, int(time.time()))
-        )
-    DB.commit()
-    # Аналогічно для Wallhaven (цикл по сторінках, зберігати md5 як hash від url)
+DB_LOCK = threading.RLock()  # prefetch пише з потоку, бот читає з event loop
+
+# ——— Схема: версіонуються через PRAGMA user_version ———
+# Кожна міграція виконується рівно один раз; на «теплій» базі при старті —
+# лише один PRAGMA. Нові зміни схеми — тільки новим елементом у кінці списку.
+def _m1_base(db):
+    db.execute("""
+    CREATE TABLE IF NOT EXISTS image_pool(
+        tag TEXT,
+        url TEXT,
+        api TEXT,
+        md5 TEXT,
+        used INT DEFAULT 0,
+        fetched INT,
+        PRIMARY KEY(tag, url)
+    )
+    """)
+    db.execute("CREATE INDEX IF NOT EXISTS idx_pool_tag_used ON image_pool(tag, used)")
+    db.execute("""
+    CREATE TABLE IF NOT EXISTS seen(
+        chat_id TEXT,
+        url TEXT,
+        PRIMARY KEY(chat_id, url)
+    )
+    """)
+    db.execute("""
+    CREATE TABLE IF NOT EXISTS sessions(
+        chat_id TEXT PRIMARY KEY,
+        url TEXT,
+        tag TEXT,
+        api TEXT,
+        file_id TEXT,
+        ts INT
+    )
+    """)
+
+def _m2_phash(db):
+    # perceptual hash для dedup.py + індекс для перевірки дублів у _insert
+    if "phash" not in [r[1] for r in db.execute("PRAGMA table_info(image_pool)")]:
+        db.execute("ALTER TABLE image_pool ADD COLUMN phash TEXT")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_pool_md5 ON image_pool(md5)")
+
+def _m3_media(db):
+    # розміри, вага і формат — щоб з пулу брати лише те, що приймає Telegram
+    cols = [r[1] for r in db.execute("PRAGMA table_info(image_pool)")]
+    for col, typ in (("width", "INT"), ("height", "INT"), ("file_size", "INT"), ("ext", "TEXT")):
+        if col not in cols:
+            db.execute(f"ALTER TABLE image_pool ADD COLUMN {col} {typ}")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_pool_tag_used_ext ON image_pool(tag, used, ext)")
+    db.execute("DROP INDEX IF EXISTS idx_pool_tag_used")  # покривається новим індексом
+
+def _m4_route_stats(db):
+    # статистика джерел по тегах для routing.py
+    db.execute("""
+    CREATE TABLE IF NOT EXISTS route_stats(
+        tag TEXT,
+        source TEXT,
+        tries INT,
+        hits INT,
+        items INT,
+        latency REAL,
+        updated INT,
+        PRIMARY KEY(tag, source)
+    )
+    """)
+
+def _m5_reservations(db):
+    # картинки, заздалегідь відкладені під розсилку підписникам (delivery.py)
+    db.execute("""
+    CREATE TABLE IF NOT EXISTS reservations(
+        chat_id TEXT,
+        url TEXT,
+        tag TEXT,
+        api TEXT,
+        due INT,
+        PRIMARY KEY(chat_id, url)
+    )
+    """)
+    db.execute("CREATE INDEX IF NOT EXISTS idx_reservations_due ON reservations(due)")
+
+def _m6_phash_tries(db):
+    # невдалі спроби dedup.py захешувати рядок (мертве посилання, завеликий файл)
+    if "phash_tries" not in [r[1] for r in db.execute("PRAGMA table_info(image_pool)")]:
+        db.execute("ALTER TABLE image_pool ADD COLUMN phash_tries INT DEFAULT 0")
+
+def _m7_pool_claims(db):
+    # used: 0 — вільна, 2 — у кільці воркера claimed_by, 1 — показана.
+    # Частковий індекс — лише по рядках у кільцях, їх небагато.
+    cols = [r[1] for r in db.execute("PRAGMA table_info(image_pool)")]
+    for col, typ in (("claimed_by", "TEXT"), ("claimed_at", "INT")):
+        if col not in cols:
+            db.execute(f"ALTER TABLE image_pool ADD COLUMN {col} {typ}")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_pool_claimed ON image_pool(claimed_by, claimed_at) WHERE used=2")
+
+def _m8_drop_file_size_index(db):
+    # жоден запит не фільтрує за file_size першим — індекс лише сповільнював вставки
+    db.execute("DROP INDEX IF EXISTS idx_pool_file_size")
+
+MIGRATIONS = [_m1_base, _m2_phash, _m3_media, _m4_route_stats, _m5_reservations, _m6_phash_tries,
+              _m7_pool_claims, _m8_drop_file_size_index]
+
+def migrate(db):
+    with DB_LOCK:
+        version = db.execute("PRAGMA user_version").fetchone()[0]
+        for i, step in enumerate(MIGRATIONS[version:], version + 1):
+            step(db)
+            db.execute(f"PRAGMA user_version={i}")
+            db.commit()
+
+migrate(DB)
+
+# ——— Пул готових картинок ———
+# Ліміти Telegram для відправки за URL: фото ≤ 5 МБ, ширина+висота ≤ 10000,
+# співвідношення сторін ≤ 20; GIF іде через send_animation (≤ 20 МБ).
+PHOTO_MAX_BYTES     = 5 * 1024 * 1024
+ANIMATION_MAX_BYTES = 20 * 1024 * 1024
+PHOTO_MAX_SIDES     = 10_000
+PHOTO_MAX_RATIO     = 20
+TELEGRAM_EXTS       = ("jpg", "jpeg", "png", "gif", "webp")  # mp4/webm/zip з бур — ні
+
+# невідомі (NULL) розміри не відсіюємо — старі рядки і джерела без метаданих
+FITS_SQL = f"""(
+    CASE WHEN ext = 'gif'
+        THEN coalesce(file_size, 0) <= {ANIMATION_MAX_BYTES}
+        ELSE coalesce(file_size, 0) <= {PHOTO_MAX_BYTES}
+            AND (width IS NULL OR height IS NULL OR (
+                width + height <= {PHOTO_MAX_SIDES}
+                AND max(width, height) <= {PHOTO_MAX_RATIO} * min(width, height)))
+    END)"""
+
+def fits_telegram(width, height, size, ext):
+    if ext and ext not in TELEGRAM_EXTS:
+        return False
+    if ext == "gif":
+        return (size or 0) <= ANIMATION_MAX_BYTES
+    if (size or 0) > PHOTO_MAX_BYTES:
+        return False
+    if width and height:
+        return width + height <= PHOTO_MAX_SIDES and max(width, height) <= PHOTO_MAX_RATIO * min(width, height)
+    return True
+
+CLAIM_TTL = 10 * 60  # сек без heartbeat — кільце вважається мертвим (збій, SIGKILL)
+
+def pool_claim(tag, n, owner):
+    # забирає до n невикористаних картинок тегу в кільце воркера owner
+    # (used=2) — інший воркер їх уже не отримає. Показаними (used=1) вони
+    # стають у pool_served. more — чи лишилось у пулі ще щось.
+    with DB_LOCK:
+        rows = DB.execute(
+            "SELECT rowid, url, api, md5, width, height, ext FROM image_pool "
+            f"WHERE tag=? AND used=0 AND {FITS_SQL} LIMIT ?", (tag, n + 1)
+        ).fetchall()
+        more = len(rows) > n
+        rows = rows[:n]
+        if rows:
+            now = int(time.time())
+            DB.executemany("UPDATE image_pool SET used=2, claimed_by=?, claimed_at=? WHERE rowid=?",
+                           [(owner, now, r[0]) for r in rows])
+            DB.commit()
+    return [r[1:] for r in rows], more
+
+def pool_served(items):
+    # (tag, url) з кільця, які вже відправлені
+    with DB_LOCK:
+        DB.executemany("UPDATE image_pool SET used=1, claimed_by=NULL WHERE tag=? AND url=?", items)
+        DB.commit()
+
+def pool_release(items):
+    # (tag, url) назад у пул: картинки, які забрали в кільце, але не показали
+    with DB_LOCK:
+        DB.executemany(
+            "UPDATE image_pool SET used=0, claimed_by=NULL WHERE tag=? AND url=? AND used=2", items)
+        DB.commit()
+
+def pool_heartbeat(owner):
+    # живий воркер продовжує свої claim-и
+    with DB_LOCK:
+        DB.execute("UPDATE image_pool SET claimed_at=? WHERE used=2 AND claimed_by=?",
+                   (int(time.time()), owner))
+        DB.commit()
+
+def pool_reclaim(ttl=CLAIM_TTL):
+    # кільця воркерів, що впали, не продовжували claim-и — повертаємо в пул
+    with DB_LOCK:
+        n = DB.execute("UPDATE image_pool SET used=0, claimed_by=NULL WHERE used=2 AND claimed_at < ?",
+                       (int(time.time()) - ttl,)).rowcount
+        DB.commit()
+    return n
+
+def pool_count(tag):
+    with DB_LOCK:
+        return DB.execute(
+            f"SELECT COUNT(*) FROM image_pool WHERE tag=? AND used=0 AND {FITS_SQL}", (tag,)
+        ).fetchone()[0]
+
+# ——— Резерв під розсилку ———
+def pool_reserve(wants):
+    # wants: [(chat_id, tag, n, due)]. На кожен тег — один SELECT на всю
+    # потрібну кількість; рядки стають used=1 і переходять у reservations.
+    # Повертає {tag: скільки не вистачило}.
+    by_tag = {}
+    for chat_id, tag, n, due in wants:
+        by_tag.setdefault(tag, []).append((str(chat_id), n, due))
+    short = {}
+    with DB_LOCK:
+        for tag, chats in by_tag.items():
+            need = sum(n for _, n, _ in chats)
+            rows = DB.execute(
+                "SELECT rowid, url, api FROM image_pool "
+                f"WHERE tag=? AND used=0 AND {FITS_SQL} LIMIT ?", (tag, need)
+            ).fetchall()
+            if len(rows) < need:
+                short[tag] = need - len(rows)
+            it = iter(rows)
+            reserved = []
+            for chat_id, n, due in chats:
+                for _, url, api in islice(it, n):
+                    reserved.append((chat_id, url, tag, api, due))
+            DB.executemany("UPDATE image_pool SET used=1 WHERE rowid=?", [(r[0],) for r in rows])
+            DB.executemany("INSERT OR IGNORE INTO reservations VALUES (?,?,?,?,?)", reserved)
+        DB.commit()
+    return short
+
+def reserved_counts():
+    with DB_LOCK:
+        return dict(DB.execute("SELECT chat_id, COUNT(*) FROM reservations GROUP BY chat_id"))
+
+def reserved_take(chat_id, n):
+    # (url, api) для відправки; з резерву вони одразу зникають
+    with DB_LOCK:
+        rows = DB.execute(
+            "SELECT rowid, url, api FROM reservations WHERE chat_id=? ORDER BY due LIMIT ?",
+            (str(chat_id), n)
+        ).fetchall()
+        if rows:
+            DB.executemany("DELETE FROM reservations WHERE rowid=?", [(r[0],) for r in rows])
+            DB.commit()
+    return [r[1:] for r in rows]
+
+def pool_unserve(urls):
+    # взяті з резерву, але так і не відправлені — назад у пул
+    with DB_LOCK:
+        DB.executemany("UPDATE image_pool SET used=0 WHERE url=? AND used=1", [(u,) for u in urls])
+        DB.commit()
+
+def reserved_release(keep_chats, stale_before):
+    # резерв відписаних чатів і прострочений — назад у пул
+    with DB_LOCK:
+        rows = [r for r in DB.execute("SELECT rowid, chat_id, tag, url, due FROM reservations")
+                if r[1] not in keep_chats or r[4] < stale_before]
+        if rows:
+            DB.executemany("UPDATE image_pool SET used=0 WHERE tag=? AND url=?", [(r[2], r[3]) for r in rows])
+            DB.executemany("DELETE FROM reservations WHERE rowid=?", [(r[0],) for r in rows])
+            DB.commit()
+    return len(rows)
+
+# ——— Negative cache: (tag, api), які нічого не повертають ———
+
+NEG_TTL = 30 * 60     # скільки секунд вважаємо тег «мертвим» для джерела
+NEG_MAX = 50_000      # максимум записів у кеші
+NEG_TOP_MAX = 1_000   # скільки тегів тримаємо в лічильниках
+
+_neg = OrderedDict()  # (tag, api) → expires
+neg_hits = {}         # tag → скільки запитів відсічено кешем
+
+def neg_is_empty(tag, api):
+    key = (tag, api)
+    exp = _neg.get(key)
+    if exp is None:
+        return False
+    if exp < time.time():
+        del _neg[key]
+        return False
+    return True
+
+def neg_mark(tag, api, ttl=NEG_TTL):
+    key = (tag, api)
+    _neg[key] = time.time() + ttl
+    _neg.move_to_end(key)
+    while len(_neg) > NEG_MAX:
+        _neg.popitem(last=False)
+
+def neg_count(tag):
+    neg_hits[tag] = neg_hits.get(tag, 0) + 1
+    if len(neg_hits) > NEG_TOP_MAX:
+        # лишаємо тільки найгарячішу половину
+        keep = sorted(neg_hits.items(), key=lambda x: x[1], reverse=True)[:NEG_TOP_MAX // 2]
+        neg_hits.clear()
+        neg_hits.update(keep)
+
+def neg_top(n=10):
+    return sorted(neg_hits.items(), key=lambda x: x[1], reverse=True)[:n]
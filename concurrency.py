@@ -0,0 +1,61 @@
+import asyncio
+
+from telegram.ext import BaseUpdateProcessor
+
+from metrics import UPDATE_LATENCY
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    # Апдейти різних чатів обробляються паралельно, апдейти одного чату —
+    # строго по черзі. max_in_flight обмежує, скільки хендлерів реально
+    # працюють одночасно; max_queued — скільки апдейтів можуть чекати
+    # (базовий семафор PTB). Семафор in-flight береться вже після локу чату,
+    # тож один чат, що спамить, не займає слоти інших.
+    def __init__(self, max_in_flight=64, max_queued=1024):
+        super().__init__(max(max_queued, max_in_flight))
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+        self._locks = {}  # key → [lock, скільки апдейтів чекає/виконується]
+
+    @staticmethod
+    def _key(update):
+        chat = getattr(update, "effective_chat", None)
+        if chat is not None:
+            return chat.id
+        user = getattr(update, "effective_user", None)  # inline-запити
+        return ("user", user.id) if user is not None else None
+
+    @staticmethod
+    def _kind(update):
+        for kind in ("message", "callback_query", "inline_query"):
+            if getattr(update, kind, None) is not None:
+                return kind
+        return "other"
+
+    async def do_process_update(self, update, coroutine):
+        with UPDATE_LATENCY.time(self._kind(update)):
+            await self._process(update, coroutine)
+
+    async def _process(self, update, coroutine):
+        key = self._key(update)
+        if key is None:
+            async with self._in_flight:
+                await coroutine
+            return
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                async with self._in_flight:
+                    await coroutine
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
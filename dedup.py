@@ -0,0 +1,126 @@
+import io, argparse, logging
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from cache import DB, DB_LOCK
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow потрібен лише для цього офлайн-кроку
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+HEADERS   = {"User-Agent": "AniBotPrefetch/1.0"}
+MAX_BYTES = 20 * 1024 * 1024  # більші файли не хешуємо
+DISTANCE  = 6                 # поріг Хеммінга для «та сама картинка»
+MAX_TRIES = 3                 # після стількох невдач рядок більше не беремо
+
+
+def dhash(data, size=8):
+    img = Image.open(io.BytesIO(data))
+    img.draft("L", (size * 8, size * 8))  # JPEG декодується одразу зменшеним
+    img = img.convert("L").resize((size + 1, size), Image.LANCZOS)
+    px = list(img.getdata())
+    h = 0
+    for row in range(size):
+        for col in range(size):
+            left = px[row * (size + 1) + col]
+            right = px[row * (size + 1) + col + 1]
+            h = (h << 1) | (left > right)
+    return h
+
+
+class BKTree:
+    # Дерево Буркхарда–Келлера за відстанню Хеммінга: пошук сусідів у
+    # радіусі d без перебору всіх хешів.
+    def __init__(self):
+        self.root = None  # [hash, item, {distance: child}]
+
+    def add(self, h, item):
+        if self.root is None:
+            self.root = [h, item, {}]
+            return
+        node = self.root
+        while True:
+            d = (h ^ node[0]).bit_count()
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [h, item, {}]
+                return
+            node = child
+
+    def search(self, h, radius):
+        found, stack = [], [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            d = (h ^ node[0]).bit_count()
+            if d <= radius:
+                found.append((d, node[1]))
+            for k, child in node[2].items():
+                if d - radius <= k <= d + radius:
+                    stack.append(child)
+        return found
+
+
+def _download_hash(row):
+    rowid, url = row
+    try:
+        with requests.get(url, headers=HEADERS, timeout=15, stream=True) as r:
+            r.raise_for_status()
+            data = bytearray()
+            for chunk in r.iter_content(64 * 1024):
+                data += chunk
+                if len(data) > MAX_BYTES:
+                    return rowid, None
+        return rowid, dhash(bytes(data))
+    except Exception as e:
+        logger.debug("dedup %s: %s", url, e)
+        return rowid, None
+
+
+def run(limit=500, workers=8, distance=DISTANCE):
+    if Image is None:
+        raise RuntimeError("Pillow is required: pip install Pillow")
+    tree = BKTree()
+    with DB_LOCK:
+        for rowid, ph in DB.execute("SELECT rowid, phash FROM image_pool WHERE phash IS NOT NULL"):
+            tree.add(int(ph, 16), rowid)
+        # свіжі рядки першими; ті, що вже не вдались MAX_TRIES разів, пропускаємо
+        todo = DB.execute(
+            "SELECT rowid, url FROM image_pool WHERE phash IS NULL AND used=0 AND phash_tries < ? "
+            "ORDER BY phash_tries LIMIT ?", (MAX_TRIES, limit)
+        ).fetchall()
+
+    hashed, dups, failed = [], [], []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for rowid, h in pool.map(_download_hash, todo):
+            if h is None:
+                failed.append((rowid,))
+                continue
+            if tree.search(h, distance):
+                dups.append((rowid,))
+            else:
+                tree.add(h, rowid)
+                hashed.append((f"{h:016x}", rowid))
+
+    with DB_LOCK:
+        DB.executemany("UPDATE image_pool SET phash=? WHERE rowid=?", hashed)
+        # дублікат не видаляємо, а позначаємо показаним: рядок з його md5
+        # лишається, і наступний prefetch не вставить той самий пост знову
+        DB.executemany("UPDATE image_pool SET used=1 WHERE rowid=?", dups)
+        DB.executemany("UPDATE image_pool SET phash_tries = phash_tries + 1 WHERE rowid=?", failed)
+        DB.commit()
+    logger.info("dedup: hashed %d, retired %d duplicates, %d failed", len(hashed), len(dups), len(failed))
+    return len(hashed), len(dups)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format="%(asctime)s %(levelname)s %(message)s", level=logging.INFO)
+    p = argparse.ArgumentParser(description="Collapse near-duplicate images in image_pool")
+    p.add_argument("--limit", type=int, default=500, help="rows to hash per run")
+    p.add_argument("--workers", type=int, default=8)
+    p.add_argument("--distance", type=int, default=DISTANCE)
+    a = p.parse_args()
+    run(a.limit, a.workers, a.distance)
@@ -0,0 +1,46 @@
+import random
+from datetime import datetime, timedelta
+
+from cache import pool_reserve, reserved_counts, reserved_release
+
+# Розсилка підписникам не ходить нагору: за RESERVE_AHEAD до часу
+# відправки під кожного підписника відкладаються картинки з пулу
+# (cache.pool_reserve), а send_scheduled лише забирає їх з резерву.
+# Чого не вистачило — докачується prefetch-ем до настання вікна.
+
+RESERVE_AHEAD = 15 * 60       # сек до часу відправки
+RESERVE_TTL   = 2 * 86400     # резерв, що так і не знадобився, повертається в пул
+
+
+def next_due(sub, now):
+    # timestamp наступної відправки (now — datetime)
+    if sub.get("interval"):
+        last = sub.get("last_time", 0) if isinstance(sub.get("last_sent", 0), str) else sub.get("last_sent", 0)
+        return (last or 0) + sub["interval"] * 60
+    if sub.get("hour") is None:
+        return None
+    today = now.replace(hour=sub["hour"], minute=0, second=0, microsecond=0)
+    if sub.get("last_day") == now.date().isoformat() or now.hour > sub["hour"]:
+        today += timedelta(days=1)
+    return today.timestamp()
+
+
+def reserve_ahead(subs, categories, now=None):
+    # subs: [(cid, sub)] — знімок підписників. Повертає {tag: нестача}.
+    now = now or datetime.now()
+    ts = now.timestamp()
+    reserved_release({cid for cid, _ in subs}, ts - RESERVE_TTL)
+    have = reserved_counts()
+    wants = {}
+    for cid, sub in subs:
+        due = next_due(sub, now)
+        if due is None or due - ts > RESERVE_AHEAD:
+            continue
+        need = sub.get("count", 1) - have.get(cid, 0)
+        # категорія — випадкова на кожну картинку, як і раніше
+        for _ in range(max(need, 0)):
+            key = (cid, random.choice(categories), int(due))
+            wants[key] = wants.get(key, 0) + 1
+    if not wants:
+        return {}
+    return pool_reserve([(cid, tag, n, due) for (cid, tag, due), n in wants.items()])
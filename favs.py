@@ -0,0 +1,79 @@
+import time, random
+
+PAGE_SIZE = 10  # максимум для send_media_group
+
+
+class FavSet:
+    # Упорядкована множина: список для порядку і випадкового доступу,
+    # словник url → індекс для O(1) перевірки на дубль.
+    __slots__ = ("_items", "_index")
+
+    def __init__(self, urls=()):
+        self._items = []
+        self._index = {}
+        for url in urls:
+            self.add(url)
+
+    def add(self, url):
+        if url in self._index:
+            return False
+        self._index[url] = len(self._items)
+        self._items.append(url)
+        return True
+
+    def __contains__(self, url):
+        return url in self._index
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def random(self):
+        return random.choice(self._items)
+
+    def page(self, n, size=PAGE_SIZE):
+        return self._items[n * size:(n + 1) * size]
+
+    def pages(self, size=PAGE_SIZE):
+        return (len(self._items) + size - 1) // size
+
+    def to_list(self):
+        return list(self._items)
+
+
+class SharedFavorites:
+    # Улюблені у спільному state-бекенді: хеш на чат url → час лайку.
+    # Лайк — один атомарний hsetnx на ключ, тож воркери не перетирають
+    # списки один одного; порядок відновлюється за часом.
+    def __init__(self, backend, prefix="favs:"):
+        self.backend = backend
+        self.prefix = prefix
+
+    def _name(self, cid):
+        return self.prefix + str(cid)
+
+    async def get(self, cid):
+        # FavSet або None, якщо лайків немає
+        items = await self.backend.hgetall(self._name(cid))
+        if not items:
+            return None
+        return FavSet(url for url, _ in sorted(items.items(), key=lambda x: float(x[1])))
+
+    async def add(self, cid, url, ts=None):
+        # False — вже є в улюблених
+        ts = time.time() if ts is None else ts
+        return await self.backend.hset(self._name(cid), url, repr(ts), only_new=True)
+
+    async def count(self, cid):
+        return await self.backend.hlen(self._name(cid))
+
+    async def clear(self, cid):
+        await self.backend.hclear(self._name(cid))
+
+    async def import_dict(self, data):
+        # favorites.json попередніх версій: cid → [url]; порядок зберігається
+        for cid, urls in data.items():
+            for i, url in enumerate(urls):
+                await self.add(cid, url, ts=i)
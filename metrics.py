@@ -0,0 +1,149 @@
+import time, bisect, threading, functools
+from contextlib import contextmanager
+
+# Мінімальні метрики у форматі Prometheus без зовнішніх залежностей.
+# Один lock на метрику: інкремент — кілька сотень наносекунд.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+REGISTRY = []
+
+
+def _fmt_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, *labels, by=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + by
+
+    def get(self, *labels):
+        return self._values.get(labels, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, v in sorted(self._values.items()):
+            lines.append(f"{self.name}{_fmt_labels(self.labelnames, labels)} {v}")
+        return lines
+
+    def summary(self):
+        return [f"{self.name}{_fmt_labels(self.labelnames, l)} = {v}"
+                for l, v in sorted(self._values.items())]
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # labels → [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            v = self._values.get(labels)
+            if v is None:
+                v = self._values[labels] = [0] * (len(self.buckets) + 2)
+            v[i] += 1
+            v[-1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, v in sorted(self._values.items()):
+            acc = 0
+            for b, c in zip(self.buckets + ("+Inf",), v[:-1]):
+                acc += c
+                le = _fmt_labels(self.labelnames, labels, [("le", b)])
+                lines.append(f"{self.name}_bucket{le} {acc}")
+            base = _fmt_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{base} {v[-1]:.6f}")
+            lines.append(f"{self.name}_count{base} {acc}")
+        return lines
+
+    def summary(self):
+        out = []
+        for labels, v in sorted(self._values.items()):
+            n = sum(v[:-1])
+            avg = v[-1] / n * 1000 if n else 0
+            out.append(f"{self.name}{_fmt_labels(self.labelnames, labels)} n={n} avg={avg:.0f}ms")
+        return out
+
+
+def timed(hist, *labels):
+    def deco(fn):
+        @functools.wraps(fn)
+        async def wrapper(*a, **kw):
+            with hist.time(*labels):
+                return await fn(*a, **kw)
+        return wrapper
+    return deco
+
+
+def render():
+    lines = []
+    for m in REGISTRY:
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+def summary():
+    lines = []
+    for m in REGISTRY:
+        lines.extend(m.summary())
+    return "\n".join(lines)
+
+
+# ——— Метрики бота ———
+FETCH_LATENCY    = Histogram("tyanpic_fetch_seconds", "Upstream image fetch latency", ["source"])
+VALIDATE_LATENCY = Histogram("tyanpic_validate_url_seconds", "validate_url HEAD latency")
+BOT_API_LATENCY  = Histogram("tyanpic_bot_api_seconds", "Telegram Bot API call latency", ["method"])
+UPDATE_LATENCY   = Histogram("tyanpic_update_seconds", "End-to-end update handling time", ["kind"])
+POOL_REQUESTS    = Counter("tyanpic_pool_requests_total", "Pool lookups in on_tag", ["result"])
+CACHE_HITS       = Counter("tyanpic_cache_hits_total", "Cache hits by cache", ["cache"])
+SOURCE_ERRORS    = Counter("tyanpic_source_errors_total", "Upstream errors by source", ["source"])
+THROTTLED        = Counter("tyanpic_throttled_total", "Updates dropped by the rate limiter", ["kind"])
+
+
+# ——— HTTP-ендпойнт /metrics ———
+async def serve(host="0.0.0.0", port=9100):
+    from aiohttp import web
+
+    async def handle(request):
+        return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+def instrumented_request(**kwargs):
+    # HTTPXRequest, що міряє кожен виклик Bot API
+    from telegram.request import HTTPXRequest
+
+    class InstrumentedRequest(HTTPXRequest):
+        async def do_request(self, url, method, *a, **kw):
+            with BOT_API_LATENCY.time(url.rsplit("/", 1)[-1]):
+                return await super().do_request(url, method, *a, **kw)
+
+    return InstrumentedRequest(**kwargs)
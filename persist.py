@@ -0,0 +1,154 @@
+import os, json, asyncio, logging, threading
+
+logger = logging.getLogger(__name__)
+
+# Збереження JSON-стану, поки не переїхали в БД:
+#   atomic_write  — тимчасовий файл + fsync + os.replace: після збою на
+#                   диску або старий, або новий файл, але не обрізаний
+#   save_later    — відкладений запис: кілька змін за FLUSH_DELAY
+#                   зливаються в один запис; на файл — один asyncio.Lock
+#   Journal       — append-only JSONL для частих подій (репорти тощо)
+
+FLUSH_DELAY = 1.0  # сек
+
+_pending = {}  # path → дані або функція, що їх повертає
+_tasks   = {}  # path → запланований flush
+_locks   = {}  # path → asyncio.Lock
+
+
+def read_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def write_text(path, text):
+    d = os.path.dirname(path)
+    if d:
+        os.makedirs(d, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+def atomic_write(path, data):
+    write_text(path, json.dumps(data, ensure_ascii=False, indent=2))
+
+
+# ——— Відкладені записи ———
+def lock_for(path):
+    lock = _locks.get(path)
+    if lock is None:
+        lock = _locks[path] = asyncio.Lock()
+    return lock
+
+def save_later(path, data, delay=FLUSH_DELAY):
+    # data — об'єкт або функція без аргументів; серіалізується в момент запису,
+    # тож до файлу потрапляє останній стан
+    _pending[path] = data
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:  # поза event loop (CLI, старт) — пишемо одразу
+        atomic_write(path, _snapshot(_pending.pop(path)))
+        return
+    if path not in _tasks:
+        _tasks[path] = loop.create_task(_flush_later(path, delay))
+
+async def _flush_later(path, delay):
+    try:
+        await asyncio.sleep(delay)
+    finally:
+        _tasks.pop(path, None)
+    await flush(path)
+
+async def flush(path):
+    async with lock_for(path):
+        if path not in _pending:
+            return
+        # знімок робимо в event loop, де ніхто не змінює дані паралельно
+        text = json.dumps(_snapshot(_pending.pop(path)), ensure_ascii=False, indent=2)
+        try:
+            await asyncio.to_thread(write_text, path, text)
+        except Exception as e:
+            logger.error("persist %s: %s", path, e)
+
+async def flush_all():
+    for task in list(_tasks.values()):
+        task.cancel()
+    _tasks.clear()
+    for path in list(_pending):
+        await flush(path)
+
+def _snapshot(data):
+    return data() if callable(data) else data
+
+
+# ——— Журнал ———
+class Journal:
+    # Один JSON на рядок, лише дописування. Обрізаний останній рядок
+    # (збій посеред запису) при читанні пропускається.
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._tail_checked = False
+
+    def append(self, entry):
+        # повертає зміщення рядка у файлі
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            prefix = ""
+            if not self._tail_checked:
+                prefix = self._fix_tail()
+                self._tail_checked = True
+            with open(self.path, "ab") as f:
+                offset = f.tell() + len(prefix)
+                f.write((prefix + line).encode("utf-8"))
+                f.flush()
+                os.fsync(f.fileno())
+        return offset
+
+    def _fix_tail(self):
+        # якщо попередній процес упав посеред рядка — починаємо з нового
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                return "" if f.read(1) == b"\n" else "\n"
+        except OSError:  # файлу нема або він порожній
+            return ""
+
+    def __iter__(self):
+        for _, entry in self.scan():
+            yield entry
+
+    def scan(self):
+        # (зміщення, запис) — для побудови індексів поверх журналу
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            offset = 0
+            for raw in f:
+                try:
+                    yield offset, json.loads(raw)
+                except ValueError:
+                    pass
+                offset += len(raw)
+
+    def read_at(self, offsets):
+        out = []
+        with open(self.path, "rb") as f:
+            for offset in offsets:
+                f.seek(offset)
+                try:
+                    out.append(json.loads(f.readline()))
+                except ValueError:
+                    pass
+        return out
@@ -0,0 +1,142 @@
+from collections import OrderedDict, deque
+
+from cache import pool_claim, pool_release, pool_served, pool_heartbeat, pool_reclaim
+from streamparse import url_ext
+
+# Картинка між image_pool і хендлерами. __slots__ замість dict: 96 байт на
+# запис проти ~270; разом із рядками url/md5 — ≈ 300 байт, тобто ~30 МБ
+# на 100k закешованих картинок.
+class ImageRecord:
+    __slots__ = ("url", "md5", "api", "tag", "width", "height", "ext", "file_id")
+
+    def __init__(self, url, api, tag, md5=None, width=None, height=None, ext=None, file_id=None):
+        self.url = url
+        self.md5 = md5
+        self.api = api
+        self.tag = tag
+        self.width = width
+        self.height = height
+        self.ext = ext or url_ext(url)
+        self.file_id = file_id
+
+    @property
+    def animated(self):
+        return self.ext == "gif"
+
+    def __repr__(self):
+        return f"ImageRecord({self.tag!r}, {self.api!r}, {self.url!r})"
+
+
+RING_BATCH = 20       # скільки картинок забираємо з SQLite за раз
+RING_MAX   = 50_000   # максимум записів у пам'яті на всі теги (~15 МБ)
+
+
+class PoolRing:
+    # tag → deque готових до відправки ImageRecord. Гарячий тег — це
+    # popleft без запиту в БД; коли черга порожня, з SQLite одним запитом
+    # забирається наступна пачка (рядки стають used=2 за owner).
+    # Відправлені позначаються used=1 пачкою у flush(), він же продовжує
+    # claim-и; після збою їх через CLAIM_TTL повертає pool_reclaim.
+    # Тег вважається «низьким», якщо після останньої пачки в SQLite для
+    # нього нічого не лишилось — тоді варто запускати prefetch.
+    def __init__(self, batch=RING_BATCH, max_total=RING_MAX, owner="local"):
+        self.batch = batch
+        self.max_total = max_total
+        self.owner = owner
+        self._rings = OrderedDict()  # LRU за тегами
+        self._total = 0
+        self._low = set()
+        self._served = []            # (tag, url), ще не позначені used=1
+
+    def take(self, tag):
+        ring = self._rings.get(tag)
+        if not ring:
+            ring = self._refill(tag)
+        if not ring:
+            return None
+        self._rings.move_to_end(tag)
+        self._total -= 1
+        rec = ring.popleft()
+        self._served.append((tag, rec.url))
+        return rec
+
+    def put_back(self, rec):
+        # взяту, але не відправлену картинку — знову на початок черги
+        try:
+            self._served.remove((rec.tag, rec.url))
+        except ValueError:
+            return  # уже позначена used=1 у flush()
+        ring = self._rings.get(rec.tag)
+        if ring is None:
+            ring = self._rings[rec.tag] = deque()
+        ring.appendleft(rec)
+        self._total += 1
+
+    def low(self, tag):
+        return tag in self._low
+
+    def replenished(self, tag):
+        # викликається після prefetch: у БД, можливо, з'явились нові рядки
+        self._low.discard(tag)
+
+    def preload(self, tags):
+        for tag in tags:
+            if not self._rings.get(tag):
+                self._refill(tag)
+
+    def flush(self):
+        # щохвилини: показане → used=1, claim-и решти продовжуються
+        served, self._served = self._served, []
+        if served:
+            pool_served(served)
+        pool_heartbeat(self.owner)
+        return len(served)
+
+    def reclaim(self):
+        # при старті: claim-и кілець, що не зупинились чисто
+        return pool_reclaim()
+
+    def release(self):
+        # при зупинці: показане фіксуємо, непоказане повертаємо в пул
+        self.flush()
+        items = [(r.tag, r.url) for ring in self._rings.values() for r in ring]
+        self._rings.clear()
+        self._total = 0
+        if items:
+            pool_release(items)
+        return len(items)
+
+    def __len__(self):
+        return self._total
+
+    def _refill(self, tag):
+        rows, more = pool_claim(tag, self.batch, self.owner)
+        if not more:
+            self._low.add(tag)
+        else:
+            self._low.discard(tag)
+        if not rows:
+            return None
+        ring = self._rings.get(tag)
+        if ring is None:
+            ring = self._rings[tag] = deque()
+        ring.extend(ImageRecord(url, api, tag, md5, w, h, ext) for url, api, md5, w, h, ext in rows)
+        self._total += len(rows)
+        self._evict(keep=tag)
+        return ring
+
+    def _evict(self, keep):
+        # найдавніші теги повертаємо в SQLite цілою чергою
+        items = []
+        while self._total > self.max_total:
+            tag = next(iter(self._rings))
+            if tag == keep:
+                self._rings.move_to_end(tag)
+                if len(self._rings) == 1:
+                    break
+                continue
+            ring = self._rings.pop(tag)
+            self._total -= len(ring)
+            items.extend((r.tag, r.url) for r in ring)
+        if items:
+            pool_release(items)
@@ -0,0 +1,151 @@
+import gzip, json, time, argparse, logging
+
+from cache import DB, DB_LOCK
+
+logger = logging.getLogger(__name__)
+
+# Вивантаження/завантаження пулу між інстансами (новий воркер, staging):
+#   python pooldump.py export pool.jsonl.gz [--format cols] [--unused]
+#   python pooldump.py import pool.jsonl.gz [--replace]
+# Файл — gzip-JSONL, читається і пишеться потоково. Для кожної таблиці
+# спершу рядок-заголовок {"table", "columns", "layout"}, далі дані:
+#   rows — рядок файлу = рядок таблиці (JSON-масив)
+#   cols — рядок файлу = пачка CHUNK рядків по стовпцях; повторювані
+#          tag/api/ext стоять поруч і стискаються в рази краще
+# file_id живуть у sessions, статистика джерел — у route_stats.
+
+TABLES = ("image_pool", "sessions", "route_stats")
+CHUNK  = 10_000
+
+# на час імпорту: без fsync на кожну сторінку, великий кеш, тимчасові
+# b-дерева індексів у пам'яті. Після — synchronous повертається як був.
+INGEST_PRAGMAS = (
+    "PRAGMA synchronous=OFF",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-262144",  # 256 МБ
+)
+
+
+def _open(path, mode):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8", compresslevel=6)
+    return open(path, mode, encoding="utf-8")
+
+def _columns(table):
+    return [r[1] for r in DB.execute(f"PRAGMA table_info({table})")]
+
+
+# ——— Export ———
+def export(path, tables=TABLES, layout="rows", unused=False):
+    counts = {}
+    with DB_LOCK, _open(path, "w") as f:
+        for table in tables:
+            cols = _columns(table)
+            if not cols:
+                continue
+            sql = f"SELECT {', '.join(cols)} FROM {table}"
+            if unused and table == "image_pool":
+                sql += " WHERE used=0"
+            f.write(json.dumps({"table": table, "columns": cols, "layout": layout}) + "\n")
+            cur = DB.execute(sql)
+            n = 0
+            while True:
+                rows = cur.fetchmany(CHUNK)
+                if not rows:
+                    break
+                n += len(rows)
+                if layout == "cols":
+                    f.write(json.dumps([list(c) for c in zip(*rows)], ensure_ascii=False) + "\n")
+                else:
+                    f.writelines(json.dumps(r, ensure_ascii=False) + "\n" for r in rows)
+            counts[table] = n
+    return counts
+
+
+# ——— Import ———
+def _sections(f):
+    # (table, columns, генератор рядків) по черзі для кожної таблиці у файлі
+    header, buf = None, []
+    for line in f:
+        obj = json.loads(line)
+        if isinstance(obj, dict):
+            if header:
+                yield header, buf
+            header, buf = obj, []
+        elif header["layout"] == "cols":
+            buf.extend(zip(*obj))
+        else:
+            buf.append(obj)
+        if len(buf) >= CHUNK:
+            yield header, buf
+            buf = []
+    if header:
+        yield header, buf
+
+def load(path, replace=False):
+    verb = "INSERT OR REPLACE" if replace else "INSERT OR IGNORE"
+    counts, indexes, targets = {}, [], {}
+    t0 = time.perf_counter()
+    with DB_LOCK:
+        sync = DB.execute("PRAGMA synchronous").fetchone()[0]
+        for pragma in INGEST_PRAGMAS:
+            DB.execute(pragma)
+        try:
+            with _open(path, "r") as f:
+                for header, rows in _sections(f):
+                    table = header["table"]
+                    if table not in TABLES:
+                        continue
+                    if table not in targets:
+                        # старіший/новіший дамп: лише спільні стовпці
+                        have = _columns(table)
+                        keep = [i for i, c in enumerate(header["columns"]) if c in have]
+                        cols = [header["columns"][i] for i in keep]
+                        targets[table] = (keep, f"{verb} INTO {table}({', '.join(cols)}) "
+                                                f"VALUES ({', '.join('?' * len(cols))})")
+                        # вторинні індекси простіше перебудувати одним проходом,
+                        # ніж оновлювати на кожній вставці
+                        for name, sql in DB.execute(
+                            "SELECT name, sql FROM sqlite_master "
+                            "WHERE type='index' AND tbl_name=? AND sql IS NOT NULL", (table,)
+                        ).fetchall():
+                            indexes.append(sql)
+                            DB.execute(f"DROP INDEX {name}")
+                        counts[table] = 0
+                    keep, sql = targets[table]
+                    before = DB.total_changes
+                    DB.executemany(sql, ([r[i] for i in keep] for r in rows))
+                    counts[table] += DB.total_changes - before
+            for sql in indexes:
+                DB.execute(sql)
+            DB.commit()
+        except BaseException:
+            DB.rollback()
+            for sql in indexes:  # DDL у sqlite3 теж у транзакції, але про всяк випадок
+                DB.execute(sql.replace("CREATE INDEX", "CREATE INDEX IF NOT EXISTS", 1))
+            DB.commit()
+            raise
+        finally:
+            DB.execute(f"PRAGMA synchronous={sync}")
+        DB.execute("ANALYZE")
+    logger.info("import: %s in %.1fs", counts, time.perf_counter() - t0)
+    return counts
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format="%(asctime)s %(levelname)s %(message)s", level=logging.INFO)
+    p = argparse.ArgumentParser(description="Export or import image_pool, sessions and route_stats")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    e = sub.add_parser("export")
+    e.add_argument("path", help="output file, .gz for gzip")
+    e.add_argument("--format", choices=("rows", "cols"), default="rows")
+    e.add_argument("--tables", nargs="+", choices=TABLES, default=TABLES)
+    e.add_argument("--unused", action="store_true", help="only image_pool rows not shown yet")
+    i = sub.add_parser("import")
+    i.add_argument("path")
+    i.add_argument("--replace", action="store_true", help="overwrite existing rows instead of skipping")
+    a = p.parse_args()
+    if a.cmd == "export":
+        logger.info("export: %s", export(a.path, a.tables, a.format, a.unused))
+    else:
+        load(a.path, a.replace)
@@ -1,77 +1,154 @@
-import time, random, requests, hashlib, xml.etree.ElementTree as ET
-from cache import CUR, DB
+import time, random, logging, hashlib
+from urllib.parse import urljoin
+from cache import DB, DB_LOCK, TELEGRAM_EXTS
 from decouple import config
+from metrics import FETCH_LATENCY, SOURCE_ERRORS
+from streamparse import XMLPosts, JSONArray, iter_posts, url_ext
+from routing import router, supports
+
+logger = logging.getLogger(__name__)
 
 WALLHAVEN_API_KEY = config("WALLHAVEN_API_KEY")
 
+# Базові адреси джерел (перевизначаються для бенчмарків/стейджингу)
+DANBOORU_URL   = config("DANBOORU_URL", default="https://danbooru.donmai.us")
+SAFEBOORU_URL  = config("SAFEBOORU_URL", default="https://safebooru.org")
+KONACHAN_URL   = config("KONACHAN_URL", default="https://konachan.net")
+WALLHAVEN_URL  = config("WALLHAVEN_URL", default="https://wallhaven.cc")
+WAIFU_PICS_URL = config("WAIFU_PICS_URL", default="https://api.waifu.pics")
+
 HEADERS = {"User-Agent": "AniBotPrefetch/1.0"}
+BATCH   = 50  # скільки постів пишемо в пул за один commit
+
+# поля, які просимо в danbooru (решта нам не потрібна)
+DANBOORU_ONLY = "file_url,md5,tag_string,rating,image_width,image_height,file_size,file_ext"
+
+def _get(url, **kw):
+    # requests імпортується лише в потоці prefetch, а не при старті бота
+    import requests
+    return requests.get(url, headers=HEADERS, **kw)
 
 def _insert(tag, url, api, md5=None):
-    if not url or not url.lower().split('?')[0].endswith(('.jpg','.jpeg','.png','.gif','.webp')):
-        return
-    if not md5:
-        md5 = hashlib.md5(url.encode()).hexdigest()
-    CUR.execute("SELECT 1 FROM image_pool WHERE md5=?", (md5,))
-    if CUR.fetchone():            # уже є така картинка
-        return
-    CUR.execute("""INSERT OR IGNORE INTO image_pool
-        (tag,url,api,md5,used,fetched) VALUES (?,?,?,?,0,?)""",
-        (tag, url, api, md5, int(time.time())))
-    DB.commit()
+    return _insert_many(tag, api, [{"url": url, "md5": md5}])
+
+def _insert_many(tag, api, posts):
+    # пачка постів → один lock і один commit; повертає, скільки нових рядків
+    now = int(time.time())
+    added = 0
+    with DB_LOCK:
+        for p in posts:
+            url, md5 = p["url"], p.get("md5")
+            ext = url_ext(url)
+            if ext not in TELEGRAM_EXTS:
+                continue
+            if not md5:
+                md5 = hashlib.md5(url.encode()).hexdigest()
+            if DB.execute("SELECT 1 FROM image_pool WHERE md5=?", (md5,)).fetchone():
+                continue              # уже є така картинка
+            added += DB.execute("""INSERT OR IGNORE INTO image_pool
+                (tag,url,api,md5,used,fetched,width,height,file_size,ext)
+                VALUES (?,?,?,?,0,?,?,?,?,?)""",
+                (tag, url, api, md5, now,
+                 p.get("width"), p.get("height"), p.get("size"), ext)).rowcount
+        DB.commit()
+    return added
+
+def _stream(tag, api, url, parser, base=None):
+    # пости йдуть у пул пачками, поки відповідь ще докачується
+    added = 0
+    with _get(url, stream=True, timeout=10) as r:
+        r.raise_for_status()
+        batch = []
+        for post in iter_posts(r, parser):
+            if base:
+                post["url"] = urljoin(base, post["url"] or "")
+            batch.append(post)
+            if len(batch) >= BATCH:
+                added += _insert_many(tag, api, batch)
+                batch = []
+        added += _insert_many(tag, api, batch)
+    return added
 
 def prefetch_danbooru(tag, n):
     try:
-        j = requests.get(
-            f"https://danbooru.donmai.us/posts.json?tags={tag}+rating:safe&limit={n}",
-            headers=HEADERS, timeout=10).json()
-        for p in j:
-            _insert(tag, p.get("file_url"), "danbooru", p.get("md5"))
-    except: pass
+        return _stream(tag, "danbooru",
+                f"{DANBOORU_URL}/posts.json?tags={tag}+rating:safe&limit={n}&only={DANBOORU_ONLY}",
+                JSONArray())
+    except Exception as e:
+        logger.warning("prefetch danbooru %s: %s", tag, e)
+        SOURCE_ERRORS.inc("danbooru")
+        return 0
 
 def prefetch_safebooru(tag, n):
     try:
-        xml = requests.get(
-            f"https://safebooru.org/index.php?page=dapi&s=post&q=index&limit={n}&tags={tag}",
-            headers=HEADERS, timeout=10).text
-        for post in ET.fromstring(xml).findall("post"):
-            url = "https:" + post.attrib.get("file_url", "")
-            _insert(tag, url, "safebooru", post.attrib.get("md5"))
-    except: pass
+        return _stream(tag, "safebooru",
+                f"{SAFEBOORU_URL}/index.php?page=dapi&s=post&q=index&limit={n}&tags={tag}",
+                XMLPosts(), base=SAFEBOORU_URL)
+    except Exception as e:
+        logger.warning("prefetch safebooru %s: %s", tag, e)
+        SOURCE_ERRORS.inc("safebooru")
+        return 0
 
 def prefetch_konachan(tag, n):
     try:
-        j = requests.get(
-            f"https://konachan.net/post.json?limit={n}&tags={tag}+rating:safe",
-            headers=HEADERS, timeout=10).json()
-        for p in j:
-            _insert(tag, p.get("file_url"), "konachan", p.get("md5"))
-    except: pass
+        return _stream(tag, "konachan",
+                f"{KONACHAN_URL}/post.json?limit={n}&tags={tag}+rating:safe",
+                JSONArray())
+    except Exception as e:
+        logger.warning("prefetch konachan %s: %s", tag, e)
+        SOURCE_ERRORS.inc("konachan")
+        return 0
 
 def prefetch_wallhaven(tag, pages=3):
+    added = 0
     try:
         for page in range(1, pages+1):
-            j = requests.get(
-                "https://wallhaven.cc/api/v1/search",
+            j = _get(
+                f"{WALLHAVEN_URL}/api/v1/search",
                 params=dict(q=tag, categories=1, purity=1, sorting="random",
                              page=page, atleast="1920x1080",
                              apikey=WALLHAVEN_API_KEY),
-                headers=HEADERS, timeout=10).json()
-            for p in j.get("data", []):
-                _insert(tag, "https:" + p["path"], "wallhaven")
-    except: pass
+                timeout=10).json()
+            added += _insert_many(tag, "wallhaven", [{
+                "url": urljoin(WALLHAVEN_URL, p["path"]),
+                "width": p.get("dimension_x"), "height": p.get("dimension_y"),
+                "size": p.get("file_size"),
+            } for p in j.get("data", [])])
+    except Exception as e:
+        logger.warning("prefetch wallhaven %s: %s", tag, e)
+        SOURCE_ERRORS.inc("wallhaven")
+    return added
 
 def prefetch_waifu_pics(tag, n=50):
-    if tag not in ("waifu","neko","hug","smile","kiss","pat","wink","cuddle"):
-        return
+    if not supports("waifu.pics", tag):
+        return 0
+    added = 0
     for _ in range(n):
         try:
-            url = requests.get(f"https://api.waifu.pics/sfw/{tag}", timeout=5).json()["url"]
-            _insert(tag, url, "waifu.pics")
-        except: pass
+            url = _get(f"{WAIFU_PICS_URL}/sfw/{tag}", timeout=5).json()["url"]
+            added += _insert(tag, url, "waifu.pics")
+        except Exception as e:
+            logger.debug("prefetch waifu.pics %s: %s", tag, e)
+            SOURCE_ERRORS.inc("waifu.pics")
+    return added
+
+PREFETCHERS = {
+    "danbooru":   (prefetch_danbooru,   lambda total: total//3),
+    "safebooru":  (prefetch_safebooru,  lambda total: total//3),
+    "konachan":   (prefetch_konachan,   lambda total: total//3),
+    "wallhaven":  (prefetch_wallhaven,  lambda total: 2),
+    "waifu.pics": (prefetch_waifu_pics, lambda total: 30),
+}
 
 def prefetch(tag, total=300):
-    prefetch_danbooru(tag, total//3)
-    prefetch_safebooru(tag, total//3)
-    prefetch_konachan(tag, total//3)
-    prefetch_wallhaven(tag, pages=2)
-    prefetch_waifu_pics(tag, 30)
+    # найпродуктивніші для тегу джерела — першими; набрали total — зупиняємось
+    added = 0
+    for name in router.order(tag, PREFETCHERS, by="yield"):
+        fn, arg = PREFETCHERS[name]
+        with FETCH_LATENCY.time(f"prefetch:{name}"):
+            n = fn(tag, arg(total))
+        router.record(tag, name, n > 0, items=n)
+        added += n
+        if added >= total:
+            break
+    return added
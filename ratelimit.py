@@ -0,0 +1,57 @@
+import time
+from collections import OrderedDict
+
+# Token bucket на ключ (chat_id / user_id) окремо для кожного виду запитів:
+# бюджет поповнюється на rate токенів за секунду до burst, кожен запит
+# забирає один. Стан — [токени, час, чи вже попередили] у LRU на max_keys
+# ключів; витіснений ключ просто починає з повного бюджету.
+
+RATE_MAX_KEYS = 100_000  # на вид; ~150 байт на запис
+
+# вид → (токенів за секунду, максимум накопичених)
+DEFAULT_BUDGETS = {
+    "tag":     (0.2, 5),    # картинка: 5 поспіль, далі 1 на 5 сек
+    "inline":  (0.5, 8),    # inline-запит летить на кожну зміну тексту
+    "command": (1.0, 10),   # решта команд і кнопок
+}
+
+
+class RateLimiter:
+    def __init__(self, budgets=None, max_keys=RATE_MAX_KEYS):
+        self.budgets = dict(budgets or DEFAULT_BUDGETS)
+        self.max_keys = max_keys
+        self._buckets = {kind: OrderedDict() for kind in self.budgets}
+        self.rejected = 0
+
+    def hit(self, kind, key, now=None):
+        # Повертає (дозволено, треба попередити): попередження — лише на
+        # першу відмову, поки бюджет знову не відновиться
+        rate, burst = self.budgets[kind]
+        now = time.monotonic() if now is None else now
+        buckets = self._buckets[kind]
+        b = buckets.get(key)
+        if b is None:
+            b = buckets[key] = [float(burst), now, False]
+            if len(buckets) > self.max_keys:
+                buckets.popitem(last=False)
+        else:
+            buckets.move_to_end(key)
+            b[0] = min(burst, b[0] + (now - b[1]) * rate)
+            b[1] = now
+        if b[0] >= 1:
+            b[0] -= 1
+            b[2] = False
+            return True, False
+        self.rejected += 1
+        warn, b[2] = not b[2], True
+        return False, warn
+
+    def retry_after(self, kind, key):
+        rate, _ = self.budgets[kind]
+        b = self._buckets[kind].get(key)
+        if b is None or b[0] >= 1:
+            return 0
+        return (1 - b[0]) / rate
+
+    def __len__(self):
+        return sum(len(b) for b in self._buckets.values())
@@ -0,0 +1,107 @@
+import os, json, time, bisect, threading
+from collections import OrderedDict
+
+from persist import Journal
+
+# Журнал репортів (reports.jsonl) + індекси в пам'яті:
+#   _offsets/_times — усі репорти в порядку надходження (час, зміщення)
+#   _by_user        — user_id → зміщення його репортів
+#   _by_image       — картинка → група репортів (для «штормів»)
+# Самі записи лежать на диску; сторінка читається seek-ом по зміщеннях.
+
+PAGE_SIZE     = 10
+DEDUP_WINDOW  = 3600             # сек: повторні репорти на ту саму картинку групуються
+STORM_NOTIFY  = (5, 20, 100)     # на яких розмірах групи ще раз пишемо адміну
+IMAGE_GROUPS_MAX = 10_000
+
+
+class ReportLog:
+    def __init__(self, path, legacy_path=None):
+        self.journal = Journal(path)
+        self.legacy_path = legacy_path
+        self._lock = threading.Lock()
+        self._offsets = []
+        self._times = []
+        self._by_user = {}
+        self._by_image = OrderedDict()  # url → {"count", "users", "first", "last"}
+
+    def load(self):
+        # старий reports.json переносимо в журнал один раз
+        if self.legacy_path and os.path.exists(self.legacy_path) and not os.path.exists(self.journal.path):
+            with open(self.legacy_path, encoding="utf-8") as f:
+                for entry in json.load(f):
+                    self.journal.append(entry)
+        for offset, entry in self.journal.scan():
+            self._index(offset, entry)
+        return len(self._offsets)
+
+    def add(self, entry):
+        # Повертає групу картинки (або None) і чи варто писати адміну
+        entry.setdefault("ts", int(time.time()))
+        offset = self.journal.append(entry)
+        with self._lock:
+            group = self._index(offset, entry)
+        if group is None:
+            return None, True
+        notify = group["count"] == 1 or group["count"] in STORM_NOTIFY
+        return group, notify
+
+    def __len__(self):
+        return len(self._offsets)
+
+    # ——— Запити ———
+    def recent(self, page=0, size=PAGE_SIZE):
+        return self._page(self._offsets, page, size)
+
+    def by_user(self, user_id, page=0, size=PAGE_SIZE):
+        return self._page(self._by_user.get(int(user_id), []), page, size)
+
+    def since(self, ts):
+        return len(self._offsets) - bisect.bisect_left(self._times, ts)
+
+    def storms(self, n=10, min_count=2):
+        groups = [(url, g) for url, g in self._by_image.items() if g["count"] >= min_count]
+        groups.sort(key=lambda x: (x[1]["count"], x[1]["last"]), reverse=True)
+        return groups[:n]
+
+    def pages(self, user_id=None, size=PAGE_SIZE):
+        n = len(self._offsets) if user_id is None else len(self._by_user.get(int(user_id), []))
+        return (n + size - 1) // size
+
+    def _page(self, offsets, page, size):
+        # найновіші — першими
+        end = len(offsets) - page * size
+        if end <= 0:
+            return []
+        chunk = offsets[max(0, end - size):end]
+        return list(reversed(self.journal.read_at(chunk)))
+
+    # ——— Індекси ———
+    def _index(self, offset, entry):
+        ts = entry.get("ts") or _parse_ts(entry.get("timestamp"))
+        self._offsets.append(offset)
+        self._times.append(ts)
+        uid = entry.get("user_id")
+        if uid is not None:
+            self._by_user.setdefault(int(uid), []).append(offset)
+        url = entry.get("image")
+        if not url:
+            return None
+        group = self._by_image.get(url)
+        if group is None or ts - group["last"] > DEDUP_WINDOW:
+            group = {"count": 0, "users": set(), "first": ts, "last": ts, "tag": entry.get("tag")}
+            self._by_image[url] = group
+        group["count"] += 1
+        group["users"].add(uid)
+        group["last"] = ts
+        self._by_image.move_to_end(url)
+        while len(self._by_image) > IMAGE_GROUPS_MAX:
+            self._by_image.popitem(last=False)
+        return group
+
+
+def _parse_ts(s):
+    try:
+        return int(time.mktime(time.strptime(s, "%Y-%m-%d %H:%M:%S")))
+    except (TypeError, ValueError):
+        return 0
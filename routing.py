@@ -0,0 +1,122 @@
+import time, random, threading
+from collections import OrderedDict
+
+from cache import DB, DB_LOCK
+
+# Маршрутизація джерел по тегах: для кожної пари (тег, джерело) рахуємо
+# спроби, успіхи, скільки картинок дало джерело і середню затримку.
+# Порядок опитування — Thompson sampling: для кожного джерела беремо
+# випадкову оцінку успіху з Beta(hits+1, misses+1) і ділимо на затримку
+# (для fetch_image) або множимо на середній вихід (для prefetch).
+# Для нового тегу апріорі — загальна статистика джерела по всіх тегах.
+
+ROUTE_MAX      = 20_000   # тегів у пам'яті (LRU)
+PRIOR_WEIGHT   = 2.0      # скільки «віртуальних спроб» дає загальна статистика
+LATENCY_ALPHA  = 0.2      # EWMA затримки
+DEFAULT_LATENCY = 1.0     # сек, поки джерело ще не міряли
+STALE_AFTER    = 30 * 86400  # рядки route_stats, старші за це, видаляються
+
+# Джерела, що вміють лише фіксований набір тегів
+SUPPORTED = {
+    "waifu.pics": {"waifu", "neko", "hug", "smile", "kiss", "pat", "wink", "cuddle"},
+}
+
+def supports(source, tag):
+    tags = SUPPORTED.get(source)
+    return tags is None or tag in tags
+
+
+class SourceRouter:
+    def __init__(self, max_tags=ROUTE_MAX):
+        self.max_tags = max_tags
+        self._lock = threading.Lock()     # record() кличуть і потоки prefetch
+        self._stats = OrderedDict()       # tag → {source: [tries, hits, items, latency]}
+        self._global = {}                 # source → [tries, hits, items, latency]
+        self._dirty = set()               # (tag, source), ще не записані в БД
+
+    # ——— Вибір порядку ———
+    def order(self, tag, sources, by="latency"):
+        sources = [s for s in sources if supports(s, tag)]
+        stats = self._tag(tag)
+        scored = []
+        with self._lock:
+            for s in sources:
+                tries, hits, items, latency = stats.get(s) or (0, 0, 0, None)
+                g = self._global.get(s)
+                rate = g[1] / g[0] if g and g[0] else 0.5
+                a = hits + 1 + PRIOR_WEIGHT * rate
+                b = tries - hits + 1 + PRIOR_WEIGHT * (1 - rate)
+                p = random.betavariate(a, b)
+                if by == "yield":
+                    per_try = items / tries if tries else (g[2] / g[0] if g and g[0] else 1)
+                    score = p * max(per_try, 1)
+                else:
+                    lat = latency or (g[3] if g and g[3] else DEFAULT_LATENCY)
+                    score = p / max(lat, 0.05)
+                scored.append((score, s))
+        scored.sort(reverse=True)
+        return [s for _, s in scored]
+
+    # ——— Облік результатів ———
+    def record(self, tag, source, ok, latency=None, items=None):
+        items = (1 if ok else 0) if items is None else items
+        stats = self._tag(tag)
+        with self._lock:
+            for row in (stats.setdefault(source, [0, 0, 0, None]),
+                        self._global.setdefault(source, [0, 0, 0, None])):
+                row[0] += 1
+                row[1] += 1 if ok else 0
+                row[2] += items
+                if latency is not None:
+                    row[3] = latency if row[3] is None else row[3] + LATENCY_ALPHA * (latency - row[3])
+            self._dirty.add((tag, source))
+
+    def table(self, tag):
+        # для адмінки/логів: source → (tries, hits, items, latency)
+        return {s: tuple(v) for s, v in self._tag(tag).items()}
+
+    # ——— SQLite ———
+    def load(self):
+        # загальна статистика джерел; потегова підтягується ліниво в _tag()
+        with DB_LOCK:
+            rows = DB.execute(
+                "SELECT source, sum(tries), sum(hits), sum(items), avg(latency) "
+                "FROM route_stats GROUP BY source"
+            ).fetchall()
+        with self._lock:
+            for source, tries, hits, items, latency in rows:
+                self._global[source] = [tries or 0, hits or 0, items or 0, latency]
+
+    def flush(self):
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            rows = [(tag, s, *self._stats[tag][s], int(time.time()))
+                    for tag, s in dirty if tag in self._stats and s in self._stats[tag]]
+        if not rows:
+            return 0
+        with DB_LOCK:
+            DB.executemany(
+                "INSERT OR REPLACE INTO route_stats(tag, source, tries, hits, items, latency, updated) "
+                "VALUES (?,?,?,?,?,?,?)", rows)
+            DB.execute("DELETE FROM route_stats WHERE updated < ?", (int(time.time() - STALE_AFTER),))
+            DB.commit()
+        return len(rows)
+
+    def _tag(self, tag):
+        with self._lock:
+            stats = self._stats.get(tag)
+            if stats is not None:
+                self._stats.move_to_end(tag)
+                return stats
+        with DB_LOCK:
+            rows = DB.execute(
+                "SELECT source, tries, hits, items, latency FROM route_stats WHERE tag=?", (tag,)
+            ).fetchall()
+        with self._lock:
+            stats = self._stats.setdefault(tag, {r[0]: list(r[1:]) for r in rows})
+            while len(self._stats) > self.max_tags:
+                self._stats.popitem(last=False)  # незаписані зміни цього тегу губляться
+            return stats
+
+
+router = SourceRouter()
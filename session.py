@@ -0,0 +1,81 @@
+import time, threading
+from collections import OrderedDict
+
+SESSION_MAX = 10_000      # скільки чатів тримаємо в пам'яті
+SESSION_TTL = 24 * 3600   # через скільки секунд сесія вважається застарілою
+PRUNE_EVERY = 1_000       # як часто чистимо застарілі рядки в БД (кількість записаних сесій)
+
+FIELDS = ("url", "tag", "api", "file_id", "ts")
+
+
+class SessionCache:
+    # Остання картинка чату (url, tag, api, file_id, ts) для /like та /same.
+    # LRU в пам'яті + TTL; пам'ять — джерело правди. Якщо передано db, змінені
+    # сесії пачкою пишуться в таблицю sessions у flush() (періодично, з потоку),
+    # а не комітом на кожну відправлену картинку.
+    # lock — той самий, що й у інших користувачів з'єднання (prefetch-потоки).
+    def __init__(self, maxsize=SESSION_MAX, ttl=SESSION_TTL, db=None, lock=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.db = db
+        self.lock = lock or threading.RLock()
+        self._data = OrderedDict()
+        self._dirty = {}  # key → entry, ще не записані (переживають витіснення з LRU)
+        self._writes = 0
+
+    def get(self, cid):
+        key = str(cid)
+        entry = self._data.get(key) or self._dirty.get(key)
+        if entry is None and self.db is not None:
+            with self.lock:
+                row = self.db.execute(
+                    "SELECT url, tag, api, file_id, ts FROM sessions WHERE chat_id=?", (key,)
+                ).fetchone()
+            if row:
+                entry = dict(zip(FIELDS, row))
+        if entry is None:
+            return None
+        if entry["ts"] < time.time() - self.ttl:
+            self._data.pop(key, None)
+            return None
+        self._put(key, entry)
+        return entry
+
+    def set(self, cid, url, tag, api, file_id=None):
+        key = str(cid)
+        entry = {"url": url, "tag": tag, "api": api, "file_id": file_id, "ts": int(time.time())}
+        self._put(key, entry)
+        if self.db is not None:
+            self._dirty[key] = entry
+        return entry
+
+    def flush(self):
+        # змінені сесії — одним executemany і одним комітом
+        if self.db is None or not self._dirty:
+            return 0
+        dirty, self._dirty = self._dirty, {}
+        rows = [(k, e["url"], e["tag"], e["api"], e["file_id"], e["ts"]) for k, e in dirty.items()]
+        with self.lock:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO sessions(chat_id, url, tag, api, file_id, ts) VALUES (?,?,?,?,?,?)",
+                rows,
+            )
+            before, self._writes = self._writes, self._writes + len(rows)
+            if before // PRUNE_EVERY != self._writes // PRUNE_EVERY:
+                self.prune()
+            self.db.commit()
+        return len(rows)
+
+    def prune(self):
+        if self.db is not None:
+            with self.lock:
+                self.db.execute("DELETE FROM sessions WHERE ts < ?", (int(time.time() - self.ttl),))
+
+    def __len__(self):
+        return len(self._data)
+
+    def _put(self, key, entry):
+        self._data[key] = entry
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
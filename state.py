@@ -0,0 +1,352 @@
+import os, json, time, socket, asyncio, sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+# Спільний стан для кількох воркерів бота: множини «очікуваних дій»
+# (репорт, sendart, swap), словники (підписники, улюблені, арти),
+# лічильники (статистика, досягнення), черга обміну і lease
+# для планувальника, щоб send_scheduled виконував лише один процес.
+#   sqlite:///data/state.db   — за замовчуванням, WAL, працює на одній машині
+#   redis://host:6379/0       — кілька машин; потрібен пакет redis
+
+DEFAULT_WORKER_ID = f"{socket.gethostname()}-{os.getpid()}"
+
+
+class SQLiteBackend:
+    # sqlite3 блокує: усі запити йдуть через один окремий потік, щоб
+    # busy_timeout при конкуренції воркерів не зупиняв event loop
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="state-db")
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("PRAGMA busy_timeout=5000")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS sets(
+            name TEXT, member TEXT, PRIMARY KEY(name, member))""")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS leases(
+            name TEXT PRIMARY KEY, owner TEXT, expires REAL)""")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS hashes(
+            name TEXT, key TEXT, value TEXT, PRIMARY KEY(name, key))""")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS queues(
+            name TEXT, member TEXT, value TEXT, ts REAL, PRIMARY KEY(name, member))""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_queues_ts ON queues(name, ts)")
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._pool, fn, *args)
+
+    def _tx(self, fn, *args):
+        # BEGIN IMMEDIATE … COMMIT; при помилці — ROLLBACK, а не напівзастосовані зміни
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(*args)
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        self.db.execute("COMMIT")
+        return result
+
+    def _exec(self, sql, params=()):
+        return self.db.execute(sql, params)
+
+    def _one(self, sql, params=()):
+        return self.db.execute(sql, params).fetchone()
+
+    def _all(self, sql, params=()):
+        return self.db.execute(sql, params).fetchall()
+
+    async def sadd(self, name, member):
+        await self._run(self._exec, "INSERT OR IGNORE INTO sets(name, member) VALUES (?,?)", (name, str(member)))
+
+    async def srem(self, name, member):
+        await self._run(self._exec, "DELETE FROM sets WHERE name=? AND member=?", (name, str(member)))
+
+    async def sismember(self, name, member):
+        return await self._run(self._one, "SELECT 1 FROM sets WHERE name=? AND member=?",
+                               (name, str(member))) is not None
+
+    async def scard(self, name):
+        return (await self._run(self._one, "SELECT COUNT(*) FROM sets WHERE name=?", (name,)))[0]
+
+    async def hset(self, name, key, value, only_new=False):
+        # True — ключ записано (з only_new: його ще не було)
+        verb = "INSERT OR IGNORE" if only_new else "INSERT OR REPLACE"
+        cur = await self._run(self._exec, f"{verb} INTO hashes(name, key, value) VALUES (?,?,?)",
+                              (name, str(key), value))
+        return cur.rowcount > 0
+
+    async def hincr(self, name, key, by=1):
+        # атомарний лічильник; повертає нове значення
+        row = await self._run(self._one, """INSERT INTO hashes(name, key, value) VALUES (?,?,?)
+            ON CONFLICT(name, key) DO UPDATE SET value = CAST(value AS INTEGER) + excluded.value
+            RETURNING value""", (name, str(key), by))
+        return int(row[0])
+
+    async def hget(self, name, key):
+        row = await self._run(self._one, "SELECT value FROM hashes WHERE name=? AND key=?", (name, str(key)))
+        return row[0] if row else None
+
+    async def hdel(self, name, key):
+        cur = await self._run(self._exec, "DELETE FROM hashes WHERE name=? AND key=?", (name, str(key)))
+        return cur.rowcount > 0
+
+    async def hgetall(self, name):
+        return dict(await self._run(self._all, "SELECT key, value FROM hashes WHERE name=?", (name,)))
+
+    async def hlen(self, name):
+        return (await self._run(self._one, "SELECT COUNT(*) FROM hashes WHERE name=?", (name,)))[0]
+
+    async def hrandom(self, name, n):
+        # до n випадкових значень
+        return [r[0] for r in await self._run(
+            self._all, "SELECT value FROM hashes WHERE name=? ORDER BY random() LIMIT ?", (name, n))]
+
+    async def hclear(self, name):
+        await self._run(self._exec, "DELETE FROM hashes WHERE name=?", (name,))
+
+    async def qoffer(self, name, member, value, ttl):
+        # Атомарно: прибрати прострочених, прибрати member, забрати найстаршого
+        # з черги або стати в неї самому. Повертає ((member, value) | None, expired)
+        return await self._run(self._tx, self._qoffer, name, str(member), value, ttl)
+
+    def _qoffer(self, name, member, value, ttl):
+        expired = self._qexpire(name, ttl)
+        self.db.execute("DELETE FROM queues WHERE name=? AND member=?", (name, member))
+        head = self.db.execute(
+            "SELECT member, value FROM queues WHERE name=? ORDER BY ts LIMIT 1", (name,)
+        ).fetchone()
+        if head:
+            self.db.execute("DELETE FROM queues WHERE name=? AND member=?", (name, head[0]))
+        else:
+            self.db.execute("INSERT INTO queues(name, member, value, ts) VALUES (?,?,?,?)",
+                            (name, member, value, time.time()))
+        return head, expired
+
+    async def qexpire(self, name, ttl):
+        return await self._run(self._tx, self._qexpire, name, ttl)
+
+    def _qexpire(self, name, ttl):
+        deadline = time.time() - ttl
+        expired = [r[0] for r in self.db.execute(
+            "SELECT member FROM queues WHERE name=? AND ts < ?", (name, deadline))]
+        if expired:
+            self.db.execute("DELETE FROM queues WHERE name=? AND ts < ?", (name, deadline))
+        return expired
+
+    async def qlen(self, name):
+        return (await self._run(self._one, "SELECT COUNT(*) FROM queues WHERE name=?", (name,)))[0]
+
+    async def acquire_lease(self, name, owner, ttl):
+        return await self._run(self._tx, self._acquire_lease, name, owner, ttl)
+
+    def _acquire_lease(self, name, owner, ttl):
+        now = time.time()
+        row = self.db.execute("SELECT owner, expires FROM leases WHERE name=?", (name,)).fetchone()
+        if row and row[0] != owner and row[1] > now:
+            return False
+        self.db.execute("INSERT OR REPLACE INTO leases(name, owner, expires) VALUES (?,?,?)",
+                        (name, owner, now + ttl))
+        return True
+
+    async def release_lease(self, name, owner):
+        await self._run(self._exec, "DELETE FROM leases WHERE name=? AND owner=?", (name, owner))
+
+
+# Черга в Redis: zset member → ts (порядок) + hash member → value.
+# Скрипт виконується атомарно, тож двоє учасників не зматчаться двічі.
+_QOFFER = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', '(' .. ARGV[4])
+for _, m in ipairs(expired) do redis.call('HDEL', KEYS[2], m) end
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', '(' .. ARGV[4])
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('HDEL', KEYS[2], ARGV[1])
+local head = redis.call('ZRANGE', KEYS[1], 0, 0)
+if #head > 0 then
+    local value = redis.call('HGET', KEYS[2], head[1])
+    redis.call('ZREM', KEYS[1], head[1])
+    redis.call('HDEL', KEYS[2], head[1])
+    return {expired, head[1], value}
+end
+redis.call('ZADD', KEYS[1], ARGV[3], ARGV[1])
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+return {expired, '', ''}
+"""
+_QEXPIRE = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', '(' .. ARGV[1])
+for _, m in ipairs(expired) do redis.call('HDEL', KEYS[2], m) end
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', '(' .. ARGV[1])
+return expired
+"""
+
+def _s(v):
+    return v.decode() if isinstance(v, bytes) else v
+
+
+class RedisBackend:
+    # client — будь-що з API redis.asyncio.Redis (для тестів підійде fakeredis)
+    def __init__(self, client, prefix="tyanpic:"):
+        self.r = client
+        self.prefix = prefix
+
+    async def sadd(self, name, member):
+        await self.r.sadd(self.prefix + name, str(member))
+
+    async def srem(self, name, member):
+        await self.r.srem(self.prefix + name, str(member))
+
+    async def sismember(self, name, member):
+        return bool(await self.r.sismember(self.prefix + name, str(member)))
+
+    async def scard(self, name):
+        return await self.r.scard(self.prefix + name)
+
+    async def hset(self, name, key, value, only_new=False):
+        if only_new:
+            return bool(await self.r.hsetnx(self.prefix + name, str(key), value))
+        await self.r.hset(self.prefix + name, str(key), value)
+        return True
+
+    async def hincr(self, name, key, by=1):
+        return int(await self.r.hincrby(self.prefix + name, str(key), by))
+
+    async def hget(self, name, key):
+        return _s(await self.r.hget(self.prefix + name, str(key)))
+
+    async def hdel(self, name, key):
+        return bool(await self.r.hdel(self.prefix + name, str(key)))
+
+    async def hgetall(self, name):
+        return {_s(k): _s(v) for k, v in (await self.r.hgetall(self.prefix + name)).items()}
+
+    async def hlen(self, name):
+        return await self.r.hlen(self.prefix + name)
+
+    async def hrandom(self, name, n):
+        flat = await self.r.hrandfield(self.prefix + name, n, withvalues=True) or []
+        return [_s(v) for v in flat[1::2]]
+
+    async def hclear(self, name):
+        await self.r.delete(self.prefix + name)
+
+    def _qkeys(self, name):
+        return [self.prefix + "q:" + name, self.prefix + "qv:" + name]
+
+    async def qoffer(self, name, member, value, ttl):
+        now = time.time()
+        expired, head, head_value = await self.r.eval(
+            _QOFFER, 2, *self._qkeys(name), str(member), value, now, now - ttl)
+        head = _s(head)
+        return ((head, _s(head_value)) if head else None), [_s(m) for m in expired]
+
+    async def qexpire(self, name, ttl):
+        expired = await self.r.eval(_QEXPIRE, 2, *self._qkeys(name), time.time() - ttl)
+        return [_s(m) for m in expired]
+
+    async def qlen(self, name):
+        return await self.r.zcard(self._qkeys(name)[0])
+
+    async def acquire_lease(self, name, owner, ttl):
+        key = self.prefix + "lease:" + name
+        if await self.r.set(key, owner, nx=True, ex=int(ttl)):
+            return True
+        current = await self.r.get(key)
+        if isinstance(current, bytes):
+            current = current.decode()
+        if current == owner:
+            await self.r.expire(key, int(ttl))
+            return True
+        return False
+
+    async def release_lease(self, name, owner):
+        key = self.prefix + "lease:" + name
+        current = await self.r.get(key)
+        if isinstance(current, bytes):
+            current = current.decode()
+        if current == owner:
+            await self.r.delete(key)
+
+
+def make_backend(url):
+    if url.startswith("redis://") or url.startswith("rediss://"):
+        import redis.asyncio as redis
+        return RedisBackend(redis.from_url(url))
+    if url.startswith("sqlite:///"):
+        return SQLiteBackend(url[len("sqlite:///"):])
+    raise ValueError(f"Unknown STATE_URL: {url}")
+
+
+class SharedSet:
+    # Множина chat_id, видима всім воркерам
+    def __init__(self, backend, name):
+        self.backend = backend
+        self.name = name
+
+    async def add(self, member):
+        await self.backend.sadd(self.name, member)
+
+    async def discard(self, member):
+        await self.backend.srem(self.name, member)
+
+    async def contains(self, member):
+        return await self.backend.sismember(self.name, member)
+
+    async def size(self):
+        return await self.backend.scard(self.name)
+
+
+class SharedDict:
+    # str(key) → JSON-значення, видиме всім воркерам
+    def __init__(self, backend, name):
+        self.backend = backend
+        self.name = name
+
+    async def get(self, key, default=None):
+        v = await self.backend.hget(self.name, key)
+        return default if v is None else json.loads(v)
+
+    async def set(self, key, value):
+        await self.backend.hset(self.name, key, json.dumps(value, ensure_ascii=False))
+
+    async def setdefault(self, key, value):
+        # True — ключа ще не було і значення записано
+        return await self.backend.hset(self.name, key, json.dumps(value, ensure_ascii=False), only_new=True)
+
+    async def delete(self, key):
+        return await self.backend.hdel(self.name, key)
+
+    async def contains(self, key):
+        return await self.backend.hget(self.name, key) is not None
+
+    async def items(self):
+        return {k: json.loads(v) for k, v in (await self.backend.hgetall(self.name)).items()}
+
+    async def size(self):
+        return await self.backend.hlen(self.name)
+
+    async def random(self, n=1):
+        return [json.loads(v) for v in await self.backend.hrandom(self.name, n)]
+
+    async def clear(self):
+        await self.backend.hclear(self.name)
+
+
+class SharedCounter:
+    # str(key) → int з атомарним incr: воркери не перетирають лічильники один одного
+    def __init__(self, backend, name):
+        self.backend = backend
+        self.name = name
+
+    async def incr(self, key, by=1):
+        return await self.backend.hincr(self.name, key, by)
+
+    async def get(self, key):
+        v = await self.backend.hget(self.name, key)
+        return int(v) if v is not None else 0
+
+    async def setdefault(self, key, n):
+        return await self.backend.hset(self.name, key, str(int(n)), only_new=True)
+
+    async def items(self):
+        return {k: int(v) for k, v in (await self.backend.hgetall(self.name)).items()}
+
+    async def clear(self):
+        await self.backend.hclear(self.name)
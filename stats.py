@@ -2,6 +2,8 @@ import json
 import os
 from datetime import date
 
+from persist import atomic_write
+
 FILE = os.path.join(os.path.dirname(__file__), "data", "stats.json")
 
 def load():
@@ -11,8 +13,7 @@ def load():
         return json.load(f)
 
 def save(data):
-    with open(FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    atomic_write(FILE, data)
 
 def incr(key, by=1):
     data = load()
@@ -0,0 +1,129 @@
+import json, codecs
+
+# Інкрементальний розбір відповідей бур: тіло подається шматками через
+# feed(), пости віддаються одразу, як тільки дочитані. З кожного поста
+# лишаємо тільки потрібні поля — решта (десятки полів у danbooru) одразу
+# йде у смітник, а не живе в пам'яті до кінця сторінки.
+
+CHUNK = 64 * 1024
+
+
+def slim(p):
+    # danbooru: tag_string/image_width/file_ext; konachan і safebooru: tags/width
+    url = p.get("file_url")
+    return {
+        "url": url,
+        "md5": p.get("md5"),
+        "tags": p.get("tag_string", p.get("tags", "")),
+        "rating": p.get("rating"),
+        "width": _int(p.get("image_width", p.get("width"))),
+        "height": _int(p.get("image_height", p.get("height"))),
+        "size": _int(p.get("file_size")),
+        "ext": (p.get("file_ext") or url_ext(url) or None),
+    }
+
+def url_ext(url):
+    if not url:
+        return ""
+    path = url.split("?", 1)[0]
+    name = path.rsplit("/", 1)[-1]
+    return name.rsplit(".", 1)[-1].lower() if "." in name else ""
+
+def _int(v):
+    try:
+        return int(v)
+    except (TypeError, ValueError):
+        return None
+
+
+class XMLPosts:
+    # <posts><post file_url=".." md5=".." .../>...</posts> (safebooru, gelbooru)
+    def __init__(self):
+        import xml.etree.ElementTree as ET  # не тягнемо expat при старті бота
+        self._parser = ET.XMLPullParser(events=("end",))
+
+    def feed(self, chunk):
+        self._parser.feed(chunk)
+        return self._drain()
+
+    def close(self):
+        self._parser.close()
+        return self._drain()
+
+    def _drain(self):
+        out = []
+        for _, el in self._parser.read_events():
+            if el.tag == "post":
+                out.append(slim(el.attrib))
+                el.clear()
+        return out
+
+
+class JSONArray:
+    # Верхньорівневий JSON-масив об'єктів (danbooru, konachan). Кожен елемент
+    # декодується, щойно його закриваюча дужка опинилась у буфері.
+    def __init__(self):
+        self._dec = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._buf = ""
+        self._started = False
+        self._done = False
+
+    def feed(self, chunk):
+        self._buf += self._utf8.decode(chunk)
+        return self._drain()
+
+    def close(self):
+        self._buf += self._utf8.decode(b"", final=True)
+        out = self._drain()
+        if not self._done and (self._started or self._buf.strip()):
+            raise ValueError("truncated JSON array")
+        return out
+
+    def _drain(self):
+        out, buf, pos = [], self._buf, 0
+        if not self._started:
+            pos = _skip(buf, pos)
+            if pos == len(buf):
+                self._buf = ""
+                return out
+            if buf[pos] != "[":
+                raise ValueError("expected JSON array")
+            self._started, pos = True, pos + 1
+        while not self._done:
+            pos = _skip(buf, pos, ",")
+            if pos == len(buf):
+                break
+            if buf[pos] == "]":
+                self._done, pos = True, pos + 1
+                break
+            try:
+                obj, end = self._dec.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                break  # елемент ще не дочитаний
+            if isinstance(obj, dict):
+                out.append(slim(obj))
+            pos = end
+        self._buf = buf[pos:]
+        return out
+
+def _skip(buf, pos, extra=""):
+    while pos < len(buf) and (buf[pos].isspace() or buf[pos] in extra):
+        pos += 1
+    return pos
+
+
+# ——— Обгортки для двох HTTP-клієнтів ———
+def iter_posts(resp, parser):
+    # requests: get(..., stream=True)
+    for chunk in resp.iter_content(CHUNK):
+        yield from parser.feed(chunk)
+    yield from parser.close()
+
+async def aiter_posts(resp, parser):
+    # aiohttp
+    async for chunk in resp.content.iter_chunked(CHUNK):
+        for post in parser.feed(chunk):
+            yield post
+    for post in parser.close():
+        yield post
@@ -0,0 +1,26 @@
+SWAP_TTL = 30 * 60  # скільки секунд картинка чекає на пару
+
+
+class SwapQueue:
+    # FIFO-черга обміну chat_id → file_id у спільному state-бекенді: пару
+    # шукає один атомарний qoffer, тож учасники з різних воркерів бачать
+    # одне одного і не зматчаться двічі.
+    def __init__(self, backend, name="swap_queue", ttl=SWAP_TTL):
+        self.backend = backend
+        self.name = name
+        self.ttl = ttl
+
+    async def size(self):
+        return await self.backend.qlen(self.name)
+
+    async def offer(self, cid, file_id):
+        # Повертає (пара, прострочені): пара — (other_cid, other_file_id) або
+        # None; прострочені — chat_id, чия картинка щойно вийшла з черги
+        head, expired = await self.backend.qoffer(self.name, cid, file_id, self.ttl)
+        expired = [int(c) for c in expired if int(c) != cid]
+        if head is None:
+            return None, expired
+        return (int(head[0]), head[1]), expired
+
+    async def expire(self):
+        return [int(c) for c in await self.backend.qexpire(self.name, self.ttl)]
@@ -0,0 +1,116 @@
+import hmac, time, signal, secrets, asyncio, logging, argparse
+
+from aiohttp import web, ClientSession
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+HEALTH_PATH   = "/healthz"
+
+
+def make_web_app(app, path, secret):
+    # без секрету будь-хто міг би підробити апдейт від імені адміна
+    if not secret:
+        raise ValueError("webhook secret is required")
+
+    async def handle_update(request):
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), secret):
+            return web.Response(status=403)
+        try:
+            data = await request.json()
+        except Exception:
+            return web.Response(status=400)
+        # тільки кладемо в чергу — Telegram отримує 200 одразу
+        await app.update_queue.put(Update.de_json(data, app.bot))
+        return web.Response()
+
+    async def health(request):
+        return web.json_response({
+            "ok": app.running,
+            "queued": app.update_queue.qsize(),
+        }, status=200 if app.running else 503)
+
+    web_app = web.Application()
+    web_app.router.add_post(path, handle_update)
+    web_app.router.add_get(HEALTH_PATH, health)
+    return web_app
+
+
+async def serve(app, listen="0.0.0.0", port=8443, path="/telegram",
+                secret=None, webhook_url=None):
+    if not secret:
+        if not webhook_url:
+            # вебхук реєструє хтось інший — секрету, який шле Telegram, ми не знаємо
+            raise SystemExit("WEBHOOK_SECRET is required when WEBHOOK_URL is not set")
+        # set_webhook нижче передасть його Telegram; живе до перезапуску
+        secret = secrets.token_urlsafe(32)
+        logger.info("WEBHOOK_SECRET not set, using a random one")
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows
+            pass
+
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+    await app.start()
+
+    runner = web.AppRunner(make_web_app(app, path, secret))
+    await runner.setup()
+    site = web.TCPSite(runner, listen, port)
+    await site.start()
+    if webhook_url:
+        await app.bot.set_webhook(webhook_url.rstrip("/") + path, secret_token=secret,
+                                  allowed_updates=Update.ALL_TYPES)
+    logger.info("Webhook server listening on %s:%s%s", listen, port, path)
+
+    try:
+        await stop.wait()
+    finally:
+        # 1) більше не приймаємо апдейти, 2) app.stop() дочікується
+        # обробки вже поставлених у чергу, 3) закриваємо все інше
+        logger.info("Shutting down webhook server…")
+        await site.stop()
+        await app.stop()
+        await runner.cleanup()
+        if app.post_shutdown:
+            await app.post_shutdown(app)
+        await app.shutdown()
+
+
+# ——— Локальне тестування: фейковий Telegram, що шле апдейти ———
+def fake_update(chat_id, text, update_id=None):
+    now = int(time.time())
+    return {
+        "update_id": update_id or now,
+        "message": {
+            "message_id": now,
+            "date": now,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Test"},
+            "text": text,
+            **({"entities": [{"type": "bot_command", "offset": 0,
+                              "length": len(text.split()[0])}]}
+               if text.startswith("/") else {}),
+        },
+    }
+
+async def post_fake_update(url, chat_id, text, secret=None):
+    headers = {SECRET_HEADER: secret} if secret else {}
+    async with ClientSession() as session:
+        async with session.post(url, json=fake_update(chat_id, text), headers=headers) as r:
+            return r.status
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Post a fake Telegram update to a local webhook")
+    p.add_argument("url", help="e.g. http://127.0.0.1:8443/telegram")
+    p.add_argument("text")
+    p.add_argument("--chat", type=int, default=1)
+    p.add_argument("--secret")
+    a = p.parse_args()
+    print(asyncio.run(post_fake_update(a.url, a.chat, a.text, a.secret)))